@@ -1,7 +1,11 @@
 # chunks.py
-import os, glob, sqlite3, time
-from typing import List, Tuple, Iterable, Dict, Optional, Any, Set
+import os, glob, heapq, sqlite3, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import islice
+from typing import List, Tuple, Iterable, Iterator, Dict, Optional, Any, Set
 from datetime import datetime, timezone
+from urllib.request import pathname2url
 import sqlite3
 
 # Families by logger mode
@@ -74,11 +78,92 @@ def _ensure_schema(path: str):
         ts   TEXT NOT NULL,
         tag  TEXT NOT NULL,
         value REAL,
-        unit TEXT
+        unit TEXT,
+        ts_epoch INTEGER
     )""")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_tag_ts ON logs(tag, ts)")
+    _ensure_epoch_indexes(cur)
     con.commit(); con.close()
 
+def _ensure_epoch_indexes(cur: sqlite3.Cursor):
+    # ts_epoch = whole-second UTC epoch of ts. Reads filter, order and bucket on
+    # it (ORDER BY ts_epoch DESC, ts DESC: ts only breaks ties within a second),
+    # so these are the only indexes a new chunk carries.
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_tag_epoch ON logs(tag, ts_epoch)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_epoch ON logs(ts_epoch)")
+
+def ensure_chunk_indexes(db_root: str) -> List[str]:
+    """
+    Startup step for chunks created by older versions: add the ts_epoch column
+    (a schema-only change, so this is quick) so new rows can be written to them.
+    Returns the chunks whose ts_epoch still needs backfilling, for
+    backfill_chunk_epochs (which is slow, so run it off the polling path).
+    """
+    stale = []
+    for fam in (F_CONTINUOUS, F_CONDITIONAL, F_ONCHANGE):
+        for path in list_chunks(db_root, fam):
+            con = sqlite3.connect(path, timeout=30)
+            try:
+                if _epoch_ready(path, con):
+                    continue
+                con.execute("PRAGMA busy_timeout=2000;")
+                cols = {r[1] for r in con.execute("PRAGMA table_info(logs)")}
+                if "ts_epoch" not in cols:
+                    con.execute("ALTER TABLE logs ADD COLUMN ts_epoch INTEGER")
+                    con.commit()
+                stale.append(path)
+            finally:
+                con.close()
+    return stale
+
+_BACKFILL_ROWS = 5000     # rows per write transaction
+_BACKFILL_PAUSE_S = 0.05  # between transactions, so the logger's own writes get in
+# busy_timeout (ms) for write_rows_chunked; raised while a backfill runs, since
+# building a chunk's indexes is one write transaction that can outlast 2 s
+_WRITE_BUSY_MS = 2000
+_BACKFILL_WRITE_BUSY_MS = 60000
+
+def backfill_chunk_epochs(paths: List[str]):
+    """
+    Fill in ts_epoch on the chunks from ensure_chunk_indexes, newest first, a
+    bounded rowid range per transaction, then build the epoch indexes. Readers
+    switch a chunk to ts_epoch once idx_logs_tag_epoch exists (_epoch_ready).
+    The old text-ts indexes stay: readers use them for chunks not yet done (and
+    a web process from before ts_epoch only knows ts); they go with the chunk
+    under retention. Interrupted work is picked up again on the next start.
+    Each family's active chunk (the newest, being written to) is done last, and
+    write_rows_chunked waits up to _BACKFILL_WRITE_BUSY_MS for the lock meanwhile.
+    """
+    global _WRITE_BUSY_MS
+    active = {max(glob.glob(_p(os.path.dirname(p), "plc-*.db")) or [p]) for p in paths}
+    _WRITE_BUSY_MS = _BACKFILL_WRITE_BUSY_MS
+    try:
+        for path in sorted(reversed(paths), key=lambda p: p in active):
+            try:
+                # mode=rw: a chunk deleted by retention in the meantime is skipped, not recreated
+                con = sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=rw",
+                                      uri=True, timeout=30)
+            except sqlite3.Error:
+                continue
+            try:
+                con.execute("PRAGMA busy_timeout=2000;")
+                # rows written since the column was added carry ts_epoch already
+                lo, hi = con.execute("SELECT MIN(rowid), MAX(rowid) FROM logs").fetchone()
+                while lo is not None and lo <= hi:
+                    con.execute("UPDATE logs SET ts_epoch = CAST(strftime('%s', ts) AS INTEGER)"
+                                " WHERE rowid >= ? AND rowid < ? AND ts_epoch IS NULL",
+                                (lo, lo + _BACKFILL_ROWS))
+                    con.commit()
+                    lo += _BACKFILL_ROWS
+                    time.sleep(_BACKFILL_PAUSE_S)
+                _ensure_epoch_indexes(con.cursor())
+                con.commit()
+            except sqlite3.Error:
+                pass
+            finally:
+                con.close()
+    finally:
+        _WRITE_BUSY_MS = 2000
+
 def _new_chunk_path(db_root: str, fam: str) -> str:
     ts = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
     return _p(chunk_dir(db_root, fam), f"plc-{ts}.db")
@@ -117,8 +202,9 @@ def write_rows_chunked(db_root: str, chunk_max_mb: int,
         p = _select_active_chunk(db_root, fam)
         con = sqlite3.connect(p, timeout=30)
         cur = con.cursor()
-        cur.execute("PRAGMA busy_timeout=2000;")
-        cur.executemany("INSERT INTO logs (ts, tag, value, unit) VALUES (?,?,?,?)", chunk)
+        cur.execute(f"PRAGMA busy_timeout={_WRITE_BUSY_MS};")
+        cur.executemany("INSERT INTO logs (ts, tag, value, unit, ts_epoch)"
+                        " VALUES (?1,?2,?3,?4, CAST(strftime('%s', ?1) AS INTEGER))", chunk)
         con.commit(); con.close()
 
 def enforce_chunk_quota(db_root: str, total_cap_mb: int, fam_caps: Optional[Dict[str,int]] = None):
@@ -180,36 +266,200 @@ def query_logs(db_root: str, tag: Optional[str], cal: str, limit: int):
     elif cal == "week":       start = now - _dt.timedelta(days=7)
     elif cal == "month":      start = now - _dt.timedelta(days=31)
     elif cal == "year":       start = now - _dt.timedelta(days=365)
-    start_iso = start.isoformat() if start else None
+    start_ep = int(start.timestamp()) if start else None
+
+    queries = {epoch: _log_select(tag, start_ep, None, epoch) for epoch in (True, False)}
 
     rows: list[tuple] = []
     for fam in fams:
         for p in list_chunks(db_root, fam)[::-1]:  # newest first
             if len(rows) >= limit: break
             con = sqlite3.connect(p, timeout=15)
-            cur = con.cursor()
-            if tag and start_iso:
-                cur.execute("""SELECT ts, tag, value, unit FROM logs
-                               WHERE tag=? AND ts>=? ORDER BY ts DESC LIMIT ?""",
-                            (tag, start_iso, limit - len(rows)))
-            elif tag:
-                cur.execute("""SELECT ts, tag, value, unit FROM logs
-                               WHERE tag=? ORDER BY ts DESC LIMIT ?""",
-                            (tag, limit - len(rows)))
-            elif start_iso:
-                cur.execute("""SELECT ts, tag, value, unit FROM logs
-                               WHERE ts>=? ORDER BY ts DESC LIMIT ?""",
-                            (start_iso, limit - len(rows)))
-            else:
-                cur.execute("""SELECT ts, tag, value, unit FROM logs
-                               ORDER BY ts DESC LIMIT ?""",
-                            (limit - len(rows),))
-            rows.extend(cur.fetchall()); con.close()
+            sql, args = queries[_epoch_ready(p, con)]
+            rows.extend(con.execute(sql, (*args, limit - len(rows))).fetchall()); con.close()
             if len(rows) >= limit: break
 
     rows.sort(key=lambda r: r[0], reverse=True)
     return rows[:limit]
 
+def _iso_epoch(iso: str) -> int:
+    """ISO bound (naive = UTC) -> whole-second epoch, matching the ts_epoch column."""
+    dt = datetime.fromisoformat(iso)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() // 1)
+
+def _epoch_key(ep: int) -> str:
+    """Whole-second epoch -> 'YYYY-MM-DDTHH:MM:SS', the naive-UTC form ts is stored in."""
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ep))
+
+# Chunks from before ts_epoch have no such column (or one still being
+# backfilled by the logger), so readers check each chunk and query those on
+# the text ts instead. idx_logs_tag_epoch is built only once the backfill is
+# done, so its presence marks a chunk as ready; that never reverts, so only
+# ready paths are remembered.
+_EPOCH_READY: Set[str] = set()
+
+def _epoch_ready(path: str, con: sqlite3.Connection) -> bool:
+    if path in _EPOCH_READY:
+        return True
+    if con.execute("SELECT 1 FROM sqlite_master"
+                   " WHERE type='index' AND name='idx_logs_tag_epoch'").fetchone():
+        _EPOCH_READY.add(path)
+        return True
+    return False
+
+def _log_where(tag: Optional[str], start_ep: Optional[int], end_ep: Optional[int],
+               epoch: bool) -> Tuple[str, tuple]:
+    """WHERE clause + args for a tag and inclusive whole-second epoch bounds.
+    Without ts_epoch the same bounds are applied to the text ts, which sorts
+    chronologically (and can use the old (tag, ts) index)."""
+    where, args = [], []
+    if tag:
+        where.append("tag=?"); args.append(tag)
+    if epoch:
+        if start_ep is not None:
+            where.append("ts_epoch>=?"); args.append(start_ep)
+        if end_ep is not None:
+            where.append("ts_epoch<=?"); args.append(end_ep)
+    else:
+        if start_ep is not None:
+            where.append("ts>=?"); args.append(_epoch_key(start_ep))
+        if end_ep is not None:
+            where.append("ts<?"); args.append(_epoch_key(end_ep + 1))
+    return (" WHERE " + " AND ".join(where) if where else ""), tuple(args)
+
+def _log_select(tag, start_ep, end_ep, epoch: bool) -> Tuple[str, tuple]:
+    """Newest-first row SELECT (LIMIT left as the last parameter)."""
+    where, args = _log_where(tag, start_ep, end_ep, epoch)
+    order = " ORDER BY ts_epoch DESC, ts DESC" if epoch else " ORDER BY ts DESC"
+    return "SELECT ts, tag, value, unit FROM logs" + where + order + " LIMIT ?", args
+
+# Read-side connection reuse (web process). Each thread keeps a small LRU of
+# open chunk connections instead of connecting per query. All the caches sit
+# in one registry, so any thread's query can close connections left on chunk
+# files that retention removed (or owned by threads that exited) and the disk
+# space is freed even if the owning worker thread sits idle. A connection is
+# only closed while no query is using it (busy == 0).
+class _Reader:
+    __slots__ = ("con", "busy")
+
+    def __init__(self, con: sqlite3.Connection):
+        self.con, self.busy = con, 0
+
+_READERS: Dict[threading.Thread, "OrderedDict[str, _Reader]"] = {}
+_READERS_LOCK = threading.Lock()
+_READERS_MAX = 16
+# Read-only tuning, applied once per pooled connection: map the file instead of
+# copying pages through read(), keep sort temp b-trees in memory. Chunks are
+# small (chunk_max_mb), so the page cache is kept modest per connection.
+_READER_PRAGMAS = """
+PRAGMA query_only=1;
+PRAGMA mmap_size=268435456;
+PRAGMA cache_size=-8192;
+PRAGMA temp_store=MEMORY;
+"""
+
+@contextmanager
+def _reader_con(path: str) -> Iterator[sqlite3.Connection]:
+    """This thread's pooled connection to path, marked busy for the block."""
+    me = threading.current_thread()
+    with _READERS_LOCK:
+        cache = _READERS.setdefault(me, OrderedDict())
+        r = cache.get(path)
+        if r is not None:
+            cache.move_to_end(path)
+            r.busy += 1
+    if r is None:
+        # check_same_thread=False: _prune_readers may close it from another thread
+        con = sqlite3.connect(path, timeout=15, check_same_thread=False)
+        con.executescript(_READER_PRAGMAS)
+        r = _Reader(con)
+        r.busy = 1
+        evict = []
+        with _READERS_LOCK:
+            cache[path] = r
+            for p in list(cache):
+                if len(cache) - len(evict) <= _READERS_MAX:
+                    break
+                if cache[p].busy == 0:
+                    evict.append(cache.pop(p).con)
+        for old in evict:
+            old.close()
+    try:
+        yield r.con
+    finally:
+        with _READERS_LOCK:
+            r.busy -= 1
+
+def _prune_readers():
+    """Close idle pooled connections (any thread's) to deleted chunks or of exited threads."""
+    stale = []
+    with _READERS_LOCK:
+        for t, cache in list(_READERS.items()):
+            alive = t.is_alive()
+            for path in [p for p, r in cache.items()
+                         if r.busy == 0 and (not alive or not os.path.exists(p))]:
+                stale.append(cache.pop(path).con)
+            if not cache and not alive:
+                del _READERS[t]
+    for con in stale:
+        con.close()
+
+_FETCH_BATCH = 1024  # rows converted per fetchmany() call
+
+def _iter_family_rows(db_root: str, fam: str, queries: Dict[bool, Tuple[str, tuple]], limit: int):
+    """
+    Yield up to `limit` rows newest→oldest from one family's chunks (each opened lazily).
+    queries: {epoch_ready: (sql, args)}, see _log_select.
+    """
+    n = 0
+    for path in list_chunks(db_root, fam)[::-1]:
+        if n >= limit:
+            return
+        with _reader_con(path) as con:
+            sql, args = queries[_epoch_ready(path, con)]
+            # close the cursor even when abandoned mid-way, so the pooled
+            # connection doesn't keep an old read snapshot open
+            cur = con.execute(sql, (*args, limit - n))
+            cur.arraysize = _FETCH_BATCH
+            try:
+                while True:
+                    batch = cur.fetchmany()
+                    if not batch:
+                        break
+                    n += len(batch)
+                    yield from batch
+            finally:
+                cur.close()
+
+def iter_logs_between(db_root: str,
+                      tag: Optional[str],
+                      start_iso: Optional[str],
+                      end_iso: Optional[str],
+                      limit: int):
+    """
+    Generator form of query_logs_between: yields (ts, tag, value, unit) tuples
+    newest→oldest straight from the SQLite cursors, without building a list.
+    Chunks within a family are time-ordered, so each family is already sorted;
+    families are merged lazily.
+    """
+    fams = [family_for_tag(tag)] if tag else [F_CONTINUOUS, F_CONDITIONAL, F_ONCHANGE]
+
+    start_ep = _iso_epoch(start_iso) if start_iso else None
+    end_ep = _iso_epoch(end_iso) if end_iso else None
+    queries = {epoch: _log_select(tag, start_ep, end_ep, epoch) for epoch in (True, False)}
+
+    limit = max(0, limit)
+    _prune_readers()
+    its = [_iter_family_rows(db_root, fam, queries, limit) for fam in fams]
+    try:
+        merged = its[0] if len(its) == 1 else heapq.merge(*its, key=lambda r: r[0], reverse=True)
+        yield from islice(merged, limit)
+    finally:
+        for it in its:
+            it.close()
+
 def query_logs_between(db_root: str,
                        tag: Optional[str],
                        start_iso: Optional[str],
@@ -217,79 +467,84 @@ def query_logs_between(db_root: str,
                        limit: int):
     """
     Return newest→oldest rows within an explicit UTC-naive ISO range.
-    - start_iso / end_iso: strings like '2025-08-22T00:00:00' (no 'Z')
+    - start_iso / end_iso: strings like '2025-08-22T00:00:00' (no 'Z'); compared
+      at whole-second resolution against ts_epoch, both ends inclusive
     - tag: filter to a single tag if provided, else search all families
     - limit: max rows returned overall (across families)
     """
-    # Pick families to search
+    return list(iter_logs_between(db_root, tag, start_iso, end_iso, limit))
+
+def query_logs_bucketed(db_root: str,
+                        tag: Optional[str],
+                        start_iso: Optional[str],
+                        end_iso: Optional[str],
+                        bucket_s: int,
+                        limit: int):
+    """
+    Average values per (tag, bucket_s window) inside SQLite, newest bucket first.
+    Returns [(bucket_start_iso_utc, tag, avg_value, unit)], at most `limit` rows.
+    Buckets are aligned to the UTC epoch; partial sums from each chunk are merged
+    so a bucket spanning two chunk files is still averaged correctly.
+    """
     fams = [family_for_tag(tag)] if tag else [F_CONTINUOUS, F_CONDITIONAL, F_ONCHANGE]
-
-    rows: list[tuple[str, str, float | None, str]] = []
-
-    # Search newest chunks first
+    bucket_s = max(1, int(bucket_s))
+
+    start_ep = _iso_epoch(start_iso) if start_iso else None
+    end_ep = _iso_epoch(end_iso) if end_iso else None
+    # Same averages as routes_api._maybe_bucket: a NULL value counts as 0
+    # (TOTAL / COUNT(*)), and the unit is the oldest row's (bare column of the
+    # MIN(ts) row), as the newest-first Python loop keeps the last one seen.
+    # tag breaks ties within a bucket so every chunk cuts its LIMIT at the same
+    # (b, tag) boundary and a kept bucket always has all of its chunks' rows.
+    # bucket start is rendered by SQLite (once per group) in the ISO form _to_iso_utc emits
+    # Chunks without a ready ts_epoch (see _epoch_ready) bucket on the parsed text ts.
+    queries = {}
+    for epoch in (True, False):
+        where, args = _log_where(tag, start_ep, end_ep, epoch)
+        ep = "ts_epoch" if epoch else "CAST(strftime('%s', ts) AS INTEGER)"
+        sql = ("SELECT b, tag, s, n, u, strftime('%Y-%m-%dT%H:%M:%S+00:00', b, 'unixepoch') FROM ("
+               f"SELECT {ep} / ? * ? AS b, tag,"
+               " TOTAL(value) AS s, COUNT(*) AS n, MIN(ts), unit AS u FROM logs"
+               + where + " GROUP BY tag, b ORDER BY b DESC, tag LIMIT ?)")
+        # Oldest row in a chunk (index min lookup). Chunks in a family are written in
+        # time order, so older chunks can only add to buckets at or below its bucket.
+        sql_floor = ("SELECT MIN(ts_epoch) FROM logs" if epoch else
+                     "SELECT CAST(strftime('%s', MIN(ts)) AS INTEGER) FROM logs")
+        queries[epoch] = (sql, (bucket_s, bucket_s, *args, limit), sql_floor)
+
+    _prune_readers()
+    acc: Dict[Tuple[str, int], list] = {}  # (tag, bucket) -> [sum, n, unit, ts_iso]
     for fam in fams:
+        fam_keys = set()
         for path in list_chunks(db_root, fam)[::-1]:
-            if len(rows) >= limit:
-                break
-            con = sqlite3.connect(path, timeout=15)
-            cur = con.cursor()
-
-            # Build the SELECT based on which bounds/tag are provided.
-            if tag and start_iso and end_iso:
-                cur.execute(
-                    """SELECT ts, tag, value, unit FROM logs
-                       WHERE tag=? AND ts>=? AND ts<=?
-                       ORDER BY ts DESC LIMIT ?""",
-                    (tag, start_iso, end_iso, max(0, limit - len(rows))),
-                )
-            elif tag and start_iso:
-                cur.execute(
-                    """SELECT ts, tag, value, unit FROM logs
-                       WHERE tag=? AND ts>=?
-                       ORDER BY ts DESC LIMIT ?""",
-                    (tag, start_iso, max(0, limit - len(rows))),
-                )
-            elif tag and end_iso:
-                cur.execute(
-                    """SELECT ts, tag, value, unit FROM logs
-                       WHERE tag=? AND ts<=?
-                       ORDER BY ts DESC LIMIT ?""",
-                    (tag, end_iso, max(0, limit - len(rows))),
-                )
-            elif start_iso and end_iso:
-                cur.execute(
-                    """SELECT ts, tag, value, unit FROM logs
-                       WHERE ts>=? AND ts<=?
-                       ORDER BY ts DESC LIMIT ?""",
-                    (start_iso, end_iso, max(0, limit - len(rows))),
-                )
-            elif start_iso:
-                cur.execute(
-                    """SELECT ts, tag, value, unit FROM logs
-                       WHERE ts>=?
-                       ORDER BY ts DESC LIMIT ?""",
-                    (start_iso, max(0, limit - len(rows))),
-                )
-            elif end_iso:
-                cur.execute(
-                    """SELECT ts, tag, value, unit FROM logs
-                       WHERE ts<=?
-                       ORDER BY ts DESC LIMIT ?""",
-                    (end_iso, max(0, limit - len(rows))),
-                )
-            else:
-                cur.execute(
-                    """SELECT ts, tag, value, unit FROM logs
-                       ORDER BY ts DESC LIMIT ?""",
-                    (max(0, limit - len(rows)),),
-                )
-
-            rows.extend(cur.fetchall())
-            con.close()
-
-            if len(rows) >= limit:
-                break
-
-    # Merge + sort newest→oldest, then trim to limit
-    rows.sort(key=lambda r: r[0], reverse=True)
-    return rows[:limit]
+            with _reader_con(path) as con:
+                sql, params, sql_floor = queries[_epoch_ready(path, con)]
+                cur = con.execute(sql, params)
+                try:
+                    for b, tg, s, n, unit, ts in cur:
+                        if b is None:
+                            continue
+                        a = acc.get((tg, b))
+                        if a is None:
+                            acc[(tg, b)] = [s, n, unit or "", ts]
+                        else:
+                            a[0] += s
+                            a[1] += n
+                            a[2] = unit or ""  # chunks go newest first: keep the oldest's
+                        fam_keys.add((tg, b))
+                finally:
+                    cur.close()
+                # oldest bucket this chunk can reach, for the early stop below
+                lo = con.execute(sql_floor).fetchone()[0] if len(fam_keys) >= limit else None
+            # stop once this family's newest `limit` buckets can't change
+            if lo is not None:
+                edge = lo // bucket_s * bucket_s
+                if sum(1 for k in fam_keys if k[1] > edge) >= limit:
+                    break
+
+    keys = heapq.nsmallest(limit, acc, key=lambda k: (-k[1], k[0]))
+    out = []
+    for tg, b in keys:
+        s, n, unit, ts = acc[(tg, b)]
+        out.append((ts, tg, (s / n) if n else None, unit))
+    return out
@@ -1,5 +1,6 @@
 # /.../Modbus-2-db/config.py
 DB_ROOT = "/home/elemech/plc_logger/data"
+DB_LAYOUT = "chunks"  # logger writes DB_ROOT/chunks/<family>/; None = let the status page detect it
 
 # Modbus / PLC
 USE_MODBUS = True
@@ -7,11 +8,18 @@ PLC_IP     = "10.0.0.1"
 PLC_PORT   = 502
 SLAVE_ID   = 1
 WORD_ORDER = "LH"   # "HL" = HI word first; "LH" = LO word first
+MODBUS_READ_GAP = 8 # setpoint reads span gaps up to this many unused registers
 
 # Timezone for web display. Logger/db always uses UTC
 LOCAL_TZ = "America/New_York"   # e.g., "America/New_York", "UTC", etc.
 WEEK_START = 0 # 0=mon, 6=sun
 
+# Compiled web templates are cached here across restarts/workers (None = per-user temp dir)
+JINJA_CACHE_DIR = None
+# Signs the session cookie that carries setpoint write messages across the
+# redirect; must be the same for all workers. None = message goes in the URL.
+SECRET_KEY = None
+
 # file management (raw-only)
 RETENTION = {
     "total_cap_mb": 10000,   # 10 GB hard cap
@@ -27,3 +35,9 @@ RETENTION = {
     # Optional overrides if a tag should live in a different family:
     # "family_overrides": {"SomeNoisyConditionalTag": "continuous"},
 }
+# Status page: False = count each rotated chunk as chunk_max_mb and stat only
+# the active one (approximate, O(1) stats per family); True = stat every file
+EXACT_SIZES = True
+# Status page: True = each web worker watches DB_ROOT (needs watchdog) and sums
+# sizes from memory; costs an event + lstat per logger write, all day, per worker
+STORAGE_INDEX = False
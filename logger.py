@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
-import time, struct, sqlite3, threading, random
+import time, socket, struct, sqlite3, sys, threading, random
+from array import array
 from datetime import datetime, timezone
 import logging
 
@@ -16,6 +17,8 @@ except Exception:
 # chunked storage (families by tag mode)
 from chunks import (
     ensure_layout,
+    ensure_chunk_indexes,
+    backfill_chunk_epochs,
     meta_path,
     write_rows_chunked,
     enforce_chunk_quota,
@@ -48,15 +51,33 @@ def get_client():
         if _client is None:
             _client = ModbusTcpClient(host=PLC_IP, port=PLC_PORT, timeout=2)
         if not getattr(_client, "connected", False):
-            _client.connect()
+            if _client.connect():
+                _tune_socket(_client)
         return _client
 
+def _tune_socket(c):
+    """Disable Nagle (Modbus PDUs are tiny request/response) and enable TCP keepalive."""
+    sock = getattr(c, "socket", None)
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    except (OSError, AttributeError):
+        pass
+
 # ------------------ DB helpers (meta.db only) ------------------
 META_DB = meta_path(DB_ROOT)
 
 def ensure_schema():
-    """Ensure directory layout and meta.db schema (state, tag_meta)."""
+    """Ensure directory layout, chunk indexes and meta.db schema (state, tag_meta)."""
     ensure_layout(DB_ROOT)
+    # older chunks get ts_epoch backfilled in the background, so polling starts now
+    stale = ensure_chunk_indexes(DB_ROOT)
+    if stale:
+        log.info("Backfilling ts_epoch in %d older chunk(s) in the background", len(stale))
+        threading.Thread(target=backfill_chunk_epochs, args=(stale,),
+                         name="ts-epoch-backfill", daemon=True).start()
     con = sqlite3.connect(META_DB, timeout=30)
     cur = con.cursor()
     cur.execute("PRAGMA journal_mode=WAL;")
@@ -142,16 +163,17 @@ def hydrate_baseline_from_chunks():
 # ------------------ Modbus decode helpers ------------------
 def to_int16(w):   return w - 65536 if w >= 32768 else w
 def to_uint16(w):  return w
-def to_int32(hi, lo):
-    if WORD_ORDER == "LH": hi, lo = lo, hi
-    v = (hi << 16) | lo
-    return v - (1<<32) if (v & 0x80000000) else v
-def to_uint32(hi, lo):
-    if WORD_ORDER == "LH": hi, lo = lo, hi
-    return (hi << 16) | lo
-def to_float32(hi, lo):
-    if WORD_ORDER == "LH": hi, lo = lo, hi
-    return struct.unpack(">f", struct.pack(">HH", hi, lo))[0]
+# Word pairs go through Structs in WORD_ORDER's byte order ("<" for LH): packing
+# (first, second) and unpacking as 32 bits puts the words in the right halves,
+# so no per-call swap is needed.
+_BO = "<" if WORD_ORDER == "LH" else ">"
+_HH_PACK = struct.Struct(_BO + "HH").pack
+_I32_UNPACK = struct.Struct(_BO + "i").unpack
+_U32_UNPACK = struct.Struct(_BO + "I").unpack
+_F32_UNPACK = struct.Struct(_BO + "f").unpack
+def to_int32(hi, lo):   return _I32_UNPACK(_HH_PACK(hi, lo))[0]
+def to_uint32(hi, lo):  return _U32_UNPACK(_HH_PACK(hi, lo))[0]
+def to_float32(hi, lo): return _F32_UNPACK(_HH_PACK(hi, lo))[0]
 
 def read_words(start_mw, count):
     cli = get_client()
@@ -162,7 +184,7 @@ def read_words(start_mw, count):
 
     if rr is None:
         raise RuntimeError(f"No response reading %MW{start_mw}..%MW{start_mw+count-1}")
-    if hasattr(rr, "isError") and rr.isError():
+    if rr.isError():
         fc = getattr(rr, "function_code", None)
         ec = getattr(rr, "exception_code", None)
         raise RuntimeError(f"Modbus exception %MW{start_mw}..%MW{start_mw+count-1}: function={fc} exception={ec} ({rr})")
@@ -188,6 +210,38 @@ def decode_from_window(words, win_start_mw, tag):
         raise ValueError(f"Unknown dtype {dtype}")
     return v * float(tag.get("scale", 1.0))
 
+# Whole-window decode: the registers are packed once into a buffer whose byte
+# order makes WORD_ORDER come out right ("<" for LH), then every tag is one
+# precompiled unpack_from; sign handling and word swap happen inside struct.
+_SWAP_REGS = (sys.byteorder == "little") != (_BO == "<")
+_UNPACKERS = {
+    "INT16":   struct.Struct(_BO + "h").unpack_from,
+    "UINT16":  struct.Struct(_BO + "H").unpack_from,
+    "INT32":   struct.Struct(_BO + "i").unpack_from,
+    "UINT32":  struct.Struct(_BO + "I").unpack_from,
+    "FLOAT32": struct.Struct(_BO + "f").unpack_from,
+}
+
+def build_decode_plan(tags, win_start_mw):
+    """[(name, unpack_from, byte_offset, scale)]; tags with unknown dtypes are left out."""
+    plan = []
+    for t in tags:
+        dtype = (t.get("dtype") or t.get("type","INT16")).upper()
+        unpack_from = _UNPACKERS.get(dtype)
+        if unpack_from is None:
+            log.warning(f"Unknown dtype {dtype} for {t.get('name')}; not decoded")
+            continue
+        plan.append((t["name"], unpack_from, 2 * (t["mw"] - win_start_mw), float(t.get("scale", 1.0))))
+    return plan
+
+def decode_window(words, plan):
+    """Decode every planned tag from a full window read -> {name: value}."""
+    a = array("H", words)
+    if _SWAP_REGS:
+        a.byteswap()
+    buf = a.tobytes()
+    return {name: unpack_from(buf, off)[0] * scale for name, unpack_from, off, scale in plan}
+
 # ------------------ Per-tag logging policy ------------------
 last_value  = {}  # name -> last numeric value (float)
 last_logged = {}  # name -> epoch seconds of last DB write
@@ -251,6 +305,7 @@ def main():
     WIN_END   = max(t["mw"] + width(t) - 1 for t in TAGS)
     WIN_COUNT = WIN_END - WIN_START + 1
     log.info(f"Reading window %MW{WIN_START}..%MW{WIN_END} ({WIN_COUNT} regs)")
+    DECODE_PLAN = build_decode_plan(TAGS, WIN_START)
 
     pending, last_flush = [], time.time()
     consecutive_errors = 0
@@ -266,14 +321,18 @@ def main():
             now_s   = time.time()
 
             # 1) Decode all current values once
-            cur_vals = {}
-            for t in TAGS:
-                try:
-                    val = decode_from_window(regs, WIN_START, t)
-                except Exception as e:
-                    log.warning(f"Decode error {t.get('name')} @%MW{t.get('mw')}: {e}")
-                    val = None
-                cur_vals[t["name"]] = val
+            if len(regs) >= WIN_COUNT:
+                cur_vals = decode_window(regs, DECODE_PLAN)
+            else:
+                # short read: decode tag by tag, leaving out-of-range ones as None
+                cur_vals = {}
+                for t in TAGS:
+                    try:
+                        val = decode_from_window(regs, WIN_START, t)
+                    except Exception as e:
+                        log.warning(f"Decode error {t.get('name')} @%MW{t.get('mw')}: {e}")
+                        val = None
+                    cur_vals[t["name"]] = val
 
             # 2) Apply per-tag logging policy
             for t in TAGS:
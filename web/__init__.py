@@ -1,21 +1,105 @@
 # webapp/__init__.py
-from flask import Flask
+import hashlib, os
+from functools import lru_cache
+from flask import Flask, request
+from jinja2 import FileSystemBytecodeCache
 from .routes_ui import ui_bp
 from .routes_api import api_bp
+from .storage_index import start_storage_index
+
+try:
+    # optional: gzip/brotli responses (pip install flask-compress)
+    from flask_compress import Compress
+except Exception:
+    Compress = None
+
+STATIC_MAX_AGE = 31536000  # 1 year; URLs carry a content hash (?v=) to bust it
 
 def create_app():
     app = Flask(__name__, static_folder="static", template_folder="templates")
+    app.config["SEND_FILE_MAX_AGE_DEFAULT"] = STATIC_MAX_AGE
+    # jsonify() fallback (no orjson/ujson): keep keys in row order, no sort pass
+    app.json.sort_keys = False
 
     from config import LOCAL_TZ
     app.jinja_env.globals.update(CONFIG_LOCAL_TZ=LOCAL_TZ)
 
+    # Persist compiled template bytecode so restarts and extra workers load it
+    # instead of re-parsing; entries are keyed by source checksum, so edits
+    # still take effect. Template auto-reload stays off unless debugging.
+    try:
+        from config import JINJA_CACHE_DIR
+    except ImportError:
+        JINJA_CACHE_DIR = None
+    try:
+        if JINJA_CACHE_DIR:
+            os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+    except (OSError, RuntimeError):
+        pass  # unwritable cache dir: compile in memory as before
+
+    try:
+        from config import SECRET_KEY
+    except ImportError:
+        SECRET_KEY = None
+    if SECRET_KEY:
+        app.secret_key = SECRET_KEY
+
     @app.context_processor
     def inject_local_tz():
         return {"CONFIG_LOCAL_TZ": LOCAL_TZ}
 
+    @lru_cache(maxsize=64)
+    def _static_hash(filename: str) -> str:
+        try:
+            with open(os.path.join(app.static_folder, filename), "rb") as f:
+                return hashlib.sha1(f.read()).hexdigest()[:12]
+        except OSError:
+            return ""
+
+    @app.url_defaults
+    def static_cache_buster(endpoint, values):
+        # url_for('static', filename=...) -> /static/<file>?v=<content hash>
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            v = _static_hash(values["filename"])
+            if v:
+                values["v"] = v
+
+    @app.after_request
+    def static_cache_headers(resp):
+        if request.path.startswith("/static/") and resp.status_code == 200:
+            resp.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+        return resp
+
+    if Compress is not None:
+        # CSV exports aren't in Flask-Compress's default list; they're streamed,
+        # so keep levels low enough that a small host isn't CPU-bound compressing.
+        app.config.setdefault("COMPRESS_MIMETYPES", [
+            "text/html", "text/css", "text/plain", "text/csv",
+            "application/javascript", "application/json",
+        ])
+        app.config.setdefault("COMPRESS_LEVEL", 1)
+        app.config.setdefault("COMPRESS_DEFLATE_LEVEL", 1)
+        Compress(app)
+
+    # Optional (watchdog, off by default): keep chunk sizes in memory for the
+    # status page. Started per process, so with gunicorn don't --preload the app.
+    try:
+        from config import STORAGE_INDEX
+    except ImportError:
+        STORAGE_INDEX = False
+    if STORAGE_INDEX:
+        from config import DB_ROOT
+        start_storage_index(DB_ROOT)
+
     app.register_blueprint(ui_bp)
     app.register_blueprint(api_bp, url_prefix="/api")
 
+    # Compile the page templates up front so the first hit on each page
+    # doesn't pay for parsing; Jinja keeps them cached for the process.
+    for name in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(name)
+
     @app.route("/healthz")
     def healthz():
         return "ok", 200
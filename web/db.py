@@ -1,8 +1,9 @@
 # web/db.py
 # Shared helpers for labels, time formatting, CSV, and lightweight state reads.
 
-import io, csv, sqlite3
+import io, csv, sqlite3, threading, time
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Optional, Dict, Any, List
 
 # --- Config / timezone ---
@@ -36,8 +37,7 @@ except Exception:
 
 # ----------------- Labels / tags -----------------
 
-def tag_label_map() -> Dict[str, str]:
-    """Return {tag: label} directly from tags.py (no DB)."""
+def _build_label_map() -> Dict[str, str]:
     m: Dict[str, str] = {}
     for t in TAGS:
         name = t.get("name")
@@ -46,25 +46,40 @@ def tag_label_map() -> Dict[str, str]:
         m[str(name)] = t.get("label", name)
     return m
 
+def _build_tag_rows() -> List[Dict[str, str]]:
+    rows = [{"tag": t.get("name"), "label": t.get("label", t.get("name", ""))}
+            for t in TAGS if t.get("name")]
+    rows.sort(key=lambda r: (r["label"] or "").lower())
+    return rows
+
+# tags.py is fixed for the process lifetime; build these once, not per request
+_LABEL_MAP = _build_label_map()
+_TAG_NAMES = [t.get("name") for t in TAGS if t.get("name")]
+_TAG_ROWS = _build_tag_rows()
+
+
+def tag_label_map() -> Dict[str, str]:
+    """Return {tag: label} directly from tags.py (no DB). Shared; do not mutate."""
+    return _LABEL_MAP
+
 
 def list_tags_with_labels() -> List[Dict[str, str]]:
     """
     Return [{'tag': name, 'label': label}] sorted by label (case-insensitive),
-    sourced from tags.py (no DB).
+    sourced from tags.py (no DB). Shared; do not mutate.
     """
-    rows = [{"tag": t.get("name"), "label": t.get("label", t.get("name", ""))}
-            for t in TAGS if t.get("name")]
-    rows.sort(key=lambda r: (r["label"] or "").lower())
-    return rows
+    return _TAG_ROWS
 
 
 def list_tags() -> List[str]:
-    """Just the tag names, from tags.py."""
-    return [t.get("name") for t in TAGS if t.get("name")]
+    """Just the tag names, from tags.py. Shared; do not mutate."""
+    return _TAG_NAMES
 
 
 # ----------------- Time formatting -----------------
 
+_TS_FMT = "%Y-%m-%d %I:%M:%S %p"
+
 def fmt_ts_local_from_iso(iso_str: str) -> str:
     """
     Convert an ISO timestamp (UTC or naive-UTC) to configured local tz string.
@@ -73,22 +88,23 @@ def fmt_ts_local_from_iso(iso_str: str) -> str:
         dt = datetime.fromisoformat(iso_str)
         if dt.tzinfo is None:
             dt = dt.replace(tzinfo=timezone.utc)
-        else:
-            dt = dt.astimezone(timezone.utc)
-        if _ZONE:
-            dt = dt.astimezone(_ZONE)
-        return dt.strftime("%Y-%m-%d %I:%M:%S %p")
+        # astimezone() converts from any offset directly; no UTC hop needed
+        dt = dt.astimezone(_ZONE or timezone.utc)
+        return dt.strftime(_TS_FMT)
     except Exception:
         return iso_str
 
 
+@lru_cache(maxsize=64)
+def _fmt_epoch(sec: float) -> str:
+    # fromtimestamp() converts straight into the target zone
+    return datetime.fromtimestamp(sec, tz=_ZONE or timezone.utc).strftime(_TS_FMT)
+
+
 def fmt_local_epoch(sec) -> Optional[str]:
+    # memoized: status polls repeat the same last-read/flush epochs until they move
     try:
-        sec = float(sec)
-        dt = datetime.fromtimestamp(sec, tz=timezone.utc)
-        if _ZONE:
-            dt = dt.astimezone(_ZONE)
-        return dt.strftime("%Y-%m-%d %I:%M:%S %p")
+        return _fmt_epoch(float(sec))
     except Exception:
         return None
 
@@ -114,25 +130,55 @@ def download_csv(rows) -> str:
 
 # ----------------- State (best-effort from meta.db) -----------------
 
-def read_state() -> Dict[str, Any]:
-    """
-    Optional: read runtime state written by logger into meta.db 'state' table.
-    Safe if file/table doesn't exist.
-    """
+_STATE_TTL = 1.0                    # seconds a state snapshot is served
+_STATE = (0.0, {})                  # (monotonic expiry, state dict)
+_STATE_LOCK = threading.Lock()
+
+
+_STATE_CON = None                   # persistent read connection to meta.db
+
+
+def _read_state_db() -> Dict[str, Any]:
+    # called with _STATE_LOCK held, which also guards _STATE_CON
+    global _STATE_CON
     try:
-        meta = meta_path(DB_ROOT)
-        con = sqlite3.connect(meta, timeout=10)
+        if _STATE_CON is None:
+            _STATE_CON = sqlite3.connect(meta_path(DB_ROOT), timeout=10, check_same_thread=False)
+            _STATE_CON.execute("PRAGMA query_only=1")
+        cur = _STATE_CON.execute("SELECT key, value FROM state")
         try:
-            cur = con.cursor()
-            cur.execute("SELECT key, value FROM state")
-            out = {str(k): float(v) for (k, v) in cur.fetchall()}
-            return out
+            return {str(k): float(v) for (k, v) in cur}
         finally:
-            con.close()
+            cur.close()
     except Exception:
+        if _STATE_CON is not None:
+            try: _STATE_CON.close()
+            except Exception: pass
+            _STATE_CON = None  # reconnect on the next refresh
         return {}
 
 
+def read_state() -> Dict[str, Any]:
+    """
+    Optional: read runtime state written by logger into meta.db 'state' table.
+    Safe if file/table doesn't exist.
+    Cached for _STATE_TTL so concurrent/polling status requests share one read.
+    Returns a copy; callers may add keys.
+    """
+    global _STATE
+    exp, val = _STATE
+    if time.monotonic() < exp:
+        return dict(val)
+    with _STATE_LOCK:
+        # another thread may have refreshed while we waited
+        exp, val = _STATE
+        now = time.monotonic()
+        if now >= exp:
+            val = _read_state_db()
+            _STATE = (now + _STATE_TTL, val)
+    return dict(val)
+
+
 # ----------------- Setpoints (from tags.py) -----------------
 
 try:
@@ -140,8 +186,7 @@ try:
 except Exception:
     TAGS_SETPOINTS = []
 
-def fetch_setpoints():
-    """Return setpoints as list of dicts for the UI."""
+def _build_setpoint_rows():
     rows = []
     for sp in TAGS_SETPOINTS:
         rows.append({
@@ -149,6 +194,14 @@ def fetch_setpoints():
             "label": sp.get("label", sp["name"]),
             "unit": sp.get("unit", ""),
             "mw": sp["mw"],
-            "dtype": sp.get("type", sp.get("dtype", "FLOAT32")),
+            # normalized here so readers/writers compare it as-is
+            "dtype": (sp.get("type", sp.get("dtype", "FLOAT32")) or "INT16").upper(),
         })
     return rows
+
+# tags.py is imported once per process, so the UI rows are built once too.
+_SETPOINT_ROWS = _build_setpoint_rows()
+
+def fetch_setpoints():
+    """Return setpoints as list of dicts for the UI (shared; do not mutate)."""
+    return _SETPOINT_ROWS
@@ -1,6 +1,9 @@
 # web/modbus.py  (patch)
 
-import logging, struct
+import inspect, logging, queue, select, socket, struct, sys, threading, time
+from contextlib import contextmanager
+from functools import lru_cache
+from array import array
 from typing import Tuple, Dict, Any, List
 from pymodbus.client import ModbusTcpClient
 
@@ -12,113 +15,303 @@ try:
 except Exception:
     PLC_IP, PLC_PORT, SLAVE_ID, USE_MODBUS = "127.0.0.1", 502, 1, False
 
-_client = None
+try:
+    from config import WORD_ORDER
+except Exception:
+    WORD_ORDER = "HL"
+
+try:
+    from config import MODBUS_READ_GAP
+except Exception:
+    MODBUS_READ_GAP = 8
+
+_MAX_READ = 125  # registers per read_holding_registers (Modbus limit)
+
+# float32 <-> two registers, compiled once. For "LH" (low word first) the
+# little-endian pair yields the words already swapped, so no Python-level swap.
+# Register buffers are packed with the same byte order so 32-bit values can be
+# read straight out of them with unpack_from.
+_BO = "<" if WORD_ORDER.upper() == "LH" else ">"
+_F32, _WORDS = struct.Struct(_BO + "f"), struct.Struct(_BO + "HH")
+_f32_pack, _f32_unpack = _F32.pack, _F32.unpack
+_words_pack, _words_unpack = _WORDS.pack, _WORDS.unpack
+
+# array('H') holds registers in host order; swap once if that isn't _BO
+_SWAP_REGS = (sys.byteorder == "little") != (_BO == "<")
+
+def _regs_to_bytes(regs) -> bytes:
+    """Pack a register list into a _BO-ordered buffer in one C-level pass."""
+    a = array("H", regs)
+    if _SWAP_REGS:
+        a.byteswap()
+    return a.tobytes()
+
+# dtype -> (register count, unpack_from on a _BO register buffer, format code)
+_DECODERS = {
+    "INT16":   (1, struct.Struct(_BO + "h").unpack_from, "h"),
+    "UINT16":  (1, struct.Struct(_BO + "H").unpack_from, "H"),
+    "INT32":   (2, struct.Struct(_BO + "i").unpack_from, "i"),
+    "UINT32":  (2, struct.Struct(_BO + "I").unpack_from, "I"),
+    "FLOAT32": (2, _F32.unpack_from, "f"),
+}
+
+# Optional: with numpy, large runs are decoded per dtype in one gather +
+# reinterpret instead of one unpack_from per setpoint.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_NP_MIN_ITEMS = 16  # below this the Struct loop is as fast
+_NP_TYPES = {"INT16": "i2", "UINT16": "u2", "INT32": "i4", "UINT32": "u4", "FLOAT32": "f4"}
+
+def _decode_np(buf: bytes, start: int, items) -> Dict[str, float]:
+    """items: [(name, mw, dtype)] inside the _BO register buffer that begins at %MW start."""
+    words = np.frombuffer(buf, dtype=_BO + "u2")
+    groups: Dict[str, list] = {}
+    for name, mw, dtype in items:
+        groups.setdefault(dtype, []).append((name, mw - start))
+    out = {}
+    for dtype, lst in groups.items():
+        offs = np.fromiter((o for _, o in lst), dtype=np.intp, count=len(lst))
+        if _DECODERS[dtype][0] == 2:
+            offs = np.column_stack((offs, offs + 1)).ravel()
+        arr = np.frombuffer(words[offs].tobytes(), dtype=_BO + _NP_TYPES[dtype])
+        out.update(zip((n for n, _ in lst), arr.astype(float).tolist()))
+    return out
+
+# Small pool of persistent clients. A pymodbus sync client must not be shared
+# by two threads at once, so each request checks one out; slots start empty
+# (None) and connect lazily.
+_POOL_SIZE = 2
+_POOL: "queue.LifoQueue[ModbusTcpClient | None]" = queue.LifoQueue(maxsize=_POOL_SIZE)
+for _ in range(_POOL_SIZE):
+    _POOL.put(None)
 
-def mb_client() -> ModbusTcpClient | None:
-    global _client
+# Reconnect backoff shared by the pool: after a failure, connect attempts are
+# refused (fast, no TCP handshake) until _retry_at, with the delay doubling
+# from _BACKOFF_MIN to _BACKOFF_MAX; any successful operation resets it.
+_BACKOFF_MIN, _BACKOFF_MAX = 0.5, 5.0
+_backoff_lock = threading.Lock()
+_backoff = 0.0
+_retry_at = 0.0
+
+class _InBackoff(ConnectionError):
+    """Connect refused locally because the last attempt failed recently."""
+
+def _note_failure():
+    global _backoff, _retry_at
+    with _backoff_lock:
+        _backoff = min(_BACKOFF_MAX, _backoff * 2) if _backoff else _BACKOFF_MIN
+        _retry_at = time.monotonic() + _backoff
+
+def _note_ok():
+    global _backoff, _retry_at
+    if _backoff:
+        with _backoff_lock:
+            _backoff, _retry_at = 0.0, 0.0
+
+def mb_client(c: ModbusTcpClient | None = None) -> ModbusTcpClient | None:
+    """
+    Return c (or a new client) connected to the PLC; None if Modbus is off.
+    An already-connected client is returned as is. Raises ConnectionError while
+    in reconnect backoff or when the connect fails.
+    """
     if not USE_MODBUS:
         return None
-    if _client is None:
-        _client = ModbusTcpClient(host=PLC_IP, port=PLC_PORT, timeout=2)
-        _client.connect()
-    return _client
+    if c is None:
+        c = ModbusTcpClient(host=PLC_IP, port=PLC_PORT, timeout=2)
+    elif getattr(c, "connected", False) and not _socket_idle_ok(c):
+        c.close()  # peer closed it, or stray bytes would desync the next reply
+    if not getattr(c, "connected", False):
+        wait = _retry_at - time.monotonic()
+        if wait > 0:
+            raise _InBackoff(f"Modbus reconnect backoff ({wait:.1f}s)")
+        if not c.connect():
+            raise ConnectionError("Modbus connect failed")
+        _tune_socket(c)
+    return c
 
-def float_to_words(val: float) -> Tuple[int, int]:
-    raw = struct.pack(">f", float(val))
-    hi, lo = struct.unpack(">HH", raw)
-    return hi, lo
+def _socket_idle_ok(c) -> bool:
+    """
+    True if an idle client's socket can carry the next request. pymodbus's
+    `connected` only checks that a socket object exists; an idle socket that
+    is readable has either been closed by the PLC or holds a late reply to an
+    earlier, timed-out request, and reusing it would pair the next request
+    with the wrong response.
+    """
+    sock = getattr(c, "socket", None)
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
 
-# ----- compatibility shims for pymodbus 2.x (unit=) vs 3.x (slave=) -----
+def _tune_socket(c):
+    """Disable Nagle (Modbus PDUs are tiny request/response) and enable TCP keepalive."""
+    sock = getattr(c, "socket", None)
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    except (OSError, AttributeError):
+        pass
 
-def _call_read_holding(c: ModbusTcpClient, **kwargs):
-    # Try new API (slave=) first
+@contextmanager
+def acquire_mb():
+    """
+    Check a connected client out of the pool for the duration of the block.
+    If the block raises, the client is closed and its slot reconnects next time
+    (subject to the reconnect backoff).
+    """
+    c = _POOL.get()
     try:
-        return c.read_holding_registers(**kwargs, slave=SLAVE_ID)
-    except TypeError as e:
-        # Fallback to old API (unit=)
-        if "unexpected keyword argument 'slave'" in str(e):
-            return c.read_holding_registers(**kwargs, unit=SLAVE_ID)
+        c = mb_client(c)
+        yield c
+        _note_ok()
+    except Exception as e:
+        if not isinstance(e, _InBackoff):
+            _note_failure()
+        if c is not None:
+            try: c.close()
+            except Exception: pass
+        c = None
         raise
+    finally:
+        _POOL.put(c)
 
-def _call_write_register(c: ModbusTcpClient, **kwargs):
+# Memoized: setpoint writes and polls keep converting the same few values.
+# WORD_ORDER is fixed per process, so the cache never goes stale.
+@lru_cache(maxsize=256)
+def float_to_words(val: float) -> Tuple[int, int]:
+    """Encode float32 to two registers, in register order per WORD_ORDER."""
+    return _words_unpack(_f32_pack(float(val)))
+
+@lru_cache(maxsize=512)
+def words_to_float(w0: int, w1: int) -> float:
+    """Decode two registers (register order per WORD_ORDER) to float32."""
+    return _f32_unpack(_words_pack(w0, w1))[0]
+
+# ----- compatibility shims for the pymodbus unit/slave/device_id kwarg -----
+# The keyword naming the target device changed across pymodbus releases
+# (2.x unit=, 3.x slave=, 3.10+ device_id=). Resolve it once at import.
+
+def _detect_unit_kw() -> str:
     try:
-        return c.write_register(**kwargs, slave=SLAVE_ID)
-    except TypeError as e:
-        if "unexpected keyword argument 'slave'" in str(e):
-            return c.write_register(**kwargs, unit=SLAVE_ID)
-        raise
+        params = inspect.signature(ModbusTcpClient.read_holding_registers).parameters
+    except (TypeError, ValueError):
+        return "slave"
+    for kw in ("device_id", "slave", "unit"):
+        if kw in params:
+            return kw
+    return "slave"
+
+_UNIT = {_detect_unit_kw(): SLAVE_ID}
+
+# Every response pymodbus returns (>= 3.5, see requirements.txt) has
+# isError(), so callers check it directly.
+def _call_read_holding(c: ModbusTcpClient, **kwargs):
+    return c.read_holding_registers(**kwargs, **_UNIT)
+
+def _call_write_register(c: ModbusTcpClient, **kwargs):
+    return c.write_register(**kwargs, **_UNIT)
 
 def _call_write_registers(c: ModbusTcpClient, **kwargs):
-    try:
-        return c.write_registers(**kwargs, slave=SLAVE_ID)
-    except TypeError as e:
-        if "unexpected keyword argument 'slave'" in str(e):
-            return c.write_registers(**kwargs, unit=SLAVE_ID)
-        raise
+    return c.write_registers(**kwargs, **_UNIT)
 
 # ----- setpoint helpers used by the UI -----
 
+@lru_cache(maxsize=8)
+def _read_plan(layout: tuple) -> tuple:
+    """
+    layout: ((name, mw, DTYPE), ...) -> ((start, count, items, names, unpack), ...).
+    Sorts by address and merges into runs: a gap of up to MODBUS_READ_GAP
+    registers is read through (cheaper than another round trip). Each run
+    also gets one Struct covering all its values, gaps as pad bytes, so it
+    decodes in a single unpack_from call; setpoints that overlap can't be
+    expressed that way and leave unpack as None. Memoized: the UI polls the
+    same setpoint list over and over.
+    """
+    plan = []
+    for name, mw, dtype in layout:
+        if dtype not in _DECODERS:
+            dtype = "UINT32"
+        plan.append((mw, _DECODERS[dtype][0], name, dtype))
+    plan.sort(key=lambda p: p[0])
+    runs = []  # [start, end, [(name, mw, dtype), ...], [format parts] or None]
+    for mw, width, name, dtype in plan:
+        r = runs[-1] if runs else None
+        if r is None or mw - r[1] > MODBUS_READ_GAP or max(r[1], mw + width) - r[0] > _MAX_READ:
+            r = [mw, mw, [], [_BO]]
+            runs.append(r)
+        if r[3] is not None:
+            if mw < r[1]:
+                r[3] = None
+            else:
+                if mw > r[1]:
+                    r[3].append(f"{2 * (mw - r[1])}x")
+                r[3].append(_DECODERS[dtype][2])
+        r[1] = max(r[1], mw + width)
+        r[2].append((name, mw, dtype))
+    return tuple((start, end - start, tuple(items), tuple(n for n, _, _ in items),
+                  struct.Struct("".join(fmt)).unpack_from if fmt is not None else None)
+                 for start, end, items, fmt in runs)
+
 def read_setpoint_block_dyn(sps: List[Dict[str, Any]]) -> tuple[Dict[str, float], str]:
     """
-    Read all configured setpoints in one windowed sweep when possible.
+    Read all configured setpoints in as few windowed reads as possible.
     Returns (values_by_name, error_message_if_any)
     """
-    c = mb_client()
-    if not c:
+    if not USE_MODBUS:
         return {}, "Modbus not enabled on server"
+    if not sps:
+        return {}, ""
 
-    # group contiguous ranges (simple approach: one by one, robust & clear)
-    vals, first_err = {}, ""
-    for sp in sps:
-        try:
-            dtype = (sp.get("dtype") or sp.get("type") or "FLOAT32").upper()
-            mw = int(sp["mw"])
-            if dtype == "INT16":
-                rr = _call_read_holding(c, address=mw, count=1)
-                regs = getattr(rr, "registers", None)
-                if rr is None or (hasattr(rr, "isError") and rr.isError()) or not regs:
-                    raise RuntimeError(rr)
-                v = regs[0]
-                # interpret as signed 16
-                if v >= 32768: v -= 65536
-                vals[sp["name"]] = float(v)
-            else:
-                rr = _call_read_holding(c, address=mw, count=2)
+    runs = _read_plan(tuple((sp["name"], int(sp["mw"]),
+                             (sp.get("dtype") or sp.get("type") or "FLOAT32").upper())
+                            for sp in sps))
+
+    vals = {}
+    start, count = runs[0][0], runs[0][1]  # for the error message
+    try:
+        with acquire_mb() as c:
+            for start, count, items, names, unpack in runs:
+                rr = _call_read_holding(c, address=start, count=count)
                 regs = getattr(rr, "registers", None)
-                if rr is None or (hasattr(rr, "isError") and rr.isError()) or not regs or len(regs) < 2:
+                if rr is None or rr.isError() or not regs or len(regs) < count:
                     raise RuntimeError(rr)
-                hi, lo = regs[0], regs[1]
-                if dtype == "FLOAT32":
-                    vals[sp["name"]] = struct.unpack(">f", struct.pack(">HH", hi, lo))[0]
-                elif dtype == "INT32":
-                    v = (hi << 16) | lo
-                    if v & 0x80000000: v -= (1<<32)
-                    vals[sp["name"]] = float(v)
-                else:  # UINT32 or default
-                    vals[sp["name"]] = float((hi << 16) | lo)
-        except Exception as e:
-            msg = f"Read exception @%MW{sp.get('mw')}: {e}"
-            log.warning(msg)
-            if not first_err:
-                first_err = msg
-
-    return vals, first_err
+                buf = _regs_to_bytes(regs[:count])
+                if np is not None and len(items) >= _NP_MIN_ITEMS:
+                    vals.update(_decode_np(buf, start, items))
+                elif unpack is not None:
+                    vals.update(zip(names, map(float, unpack(buf))))
+                else:
+                    for name, mw, dtype in items:
+                        vals[name] = float(_DECODERS[dtype][1](buf, 2 * (mw - start))[0])
+    except Exception as e:
+        msg = f"Read exception @%MW{start}..%MW{start + count - 1}: {e}"
+        log.warning(msg)
+        return vals, msg
+    return vals, ""
 
 def write_setpoint(name: str, sp: Dict[str, Any], fval: float) -> tuple[bool, str]:
     """Write a single setpoint; returns (ok, message)."""
-    c = mb_client()
-    if not c:
+    if not USE_MODBUS:
         return False, "Modbus not enabled on server"
 
     try:
         mw = int(sp["mw"])
         dtype = (sp.get("dtype") or sp.get("type") or "FLOAT32").upper()
-        if dtype == "INT16":
-            r = _call_write_register(c, address=mw, value=int(fval))
-        else:
-            hi, lo = float_to_words(fval)
-            r = _call_write_registers(c, address=mw, values=[hi, lo])
-        ok = not (hasattr(r, "isError") and r.isError())
+        with acquire_mb() as c:
+            if dtype == "INT16":
+                r = _call_write_register(c, address=mw, value=int(fval))
+            else:
+                hi, lo = float_to_words(fval)
+                r = _call_write_registers(c, address=mw, values=[hi, lo])
+        ok = not r.isError()
         return ok, ("OK" if ok else "Write failed")
     except Exception as e:
         return False, f"Write exception: {e}"
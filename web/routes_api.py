@@ -1,20 +1,46 @@
 # API routes: /api/logs, /api/download.csv
 
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from config import DB_ROOT, RETENTION, LOCAL_TZ
 from tags import TAGS
 from chunks import query_logs, init_family_router, meta_path
-import csv, io, os, sqlite3
+import os, sqlite3, threading, time
+from functools import lru_cache
 from typing import Optional, Tuple
 from datetime import datetime, timezone, timedelta
 
 try:
     # optional: if you implemented it
-    from chunks import query_logs_between
+    from chunks import query_logs_between, iter_logs_between
     HAS_QB = True
 except Exception:
     HAS_QB = False
 
+try:
+    # optional: SQL-side bucket averaging
+    from chunks import query_logs_bucketed
+    HAS_QBUCKET = True
+except Exception:
+    HAS_QBUCKET = False
+
+try:
+    # optional: C JSON encoder for large /api/logs payloads
+    import orjson
+except Exception:
+    orjson = None
+
+try:
+    # optional: second choice when orjson isn't installed
+    import ujson
+except Exception:
+    ujson = None
+
+try:
+    # optional: vectorized bucketing of large raw row sets
+    import numpy as np
+except Exception:
+    np = None
+
 # Optional: week start (0=Mon..6=Sun)
 try:
     from config import WEEK_START
@@ -37,36 +63,52 @@ init_family_router(TAGS, RETENTION.get("family_overrides"))
 
 api_bp = Blueprint("api", __name__)
 
+# {tag: label} from tags.py; static for the process lifetime
+_LABELS = {t["name"]: t.get("label", t["name"]) for t in TAGS}
+
 # ---------- helpers ----------
 
 _TAGMAP_CACHE = {"mtime": 0, "map": {}}
+_META_LOCK = threading.Lock()
+_META_CON = None  # persistent read connection to meta.db (rebuilds reuse it)
 
 def _tag_map():
-    """Return {tag: {'label': str, 'unit': str}} from meta.db, cached by file mtime."""
+    """Return {tag: (label, unit)} from meta.db, cached by file mtime."""
+    global _META_CON
     meta = meta_path(DB_ROOT)
-    mtime = os.path.getmtime(meta) if os.path.exists(meta) else 0
+    try:
+        mtime = os.path.getmtime(meta)
+    except OSError:
+        mtime = 0
     if mtime != _TAGMAP_CACHE["mtime"]:
         d = {}
         if mtime:
-            con = sqlite3.connect(meta, timeout=10)
-            cur = con.cursor()
-            try:
-                cur.execute("SELECT tag, label, unit FROM tag_meta")
-                for t, lbl, unit in cur.fetchall():
-                    d[str(t)] = {"label": lbl or str(t), "unit": unit or ""}
-            finally:
-                cur.close(); con.close()
+            with _META_LOCK:
+                if _META_CON is None:
+                    _META_CON = sqlite3.connect(meta, timeout=10, check_same_thread=False)
+                    _META_CON.execute("PRAGMA query_only=1")
+                try:
+                    cur = _META_CON.execute("SELECT tag, label, unit FROM tag_meta")
+                    try:
+                        d = {str(t): (lbl or str(t), unit or "") for t, lbl, unit in cur}
+                    finally:
+                        cur.close()
+                except sqlite3.Error:
+                    _META_CON.close()  # e.g. meta.db replaced; reconnect next time
+                    _META_CON = None
+                    raise
         _TAGMAP_CACHE["mtime"] = mtime
         _TAGMAP_CACHE["map"] = d
     return _TAGMAP_CACHE["map"]
 
 def _to_utc(dt_local: datetime) -> str:
+    # Wall time in LOCAL_TZ -> UTC ISO. Subtracting the zone's utcoffset() for
+    # that wall time is what astimezone() does (same fold handling), minus the
+    # intermediate aware datetimes.
+    dt_local = dt_local.replace(tzinfo=None)
     if _LOCAL_TZ:
-        dt_local = dt_local.replace(tzinfo=_LOCAL_TZ)
-        dt_utc = dt_local.astimezone(timezone.utc)
-    else:
-        dt_utc = dt_local.replace(tzinfo=timezone.utc)
-    return dt_utc.isoformat()
+        dt_local = dt_local - _LOCAL_TZ.utcoffset(dt_local)
+    return dt_local.isoformat() + "+00:00"
 
 def _parse_int(s, default):
     try: return int(s)
@@ -75,16 +117,23 @@ def _parse_int(s, default):
 def _parse_local_dt(s: str) -> Optional[datetime]:
      if not s: return None
      try:
-         return datetime.fromisoformat(s)
+         dt = datetime.fromisoformat(s)
      except Exception:
          return None
-
-def _bounds_from_request(cal: str, start_s: Optional[str], end_s: Optional[str]) -> Tuple[str, str]:
+     if dt.tzinfo is not None:
+         # explicit offset -> local wall time, so it compares with naive inputs
+         dt = dt.astimezone(_LOCAL_TZ or timezone.utc).replace(tzinfo=None)
+     return dt
+
+def _bounds_from_request(cal: str, start_s: Optional[str], end_s: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+     """(start_iso, end_iso) in UTC; (None, None) for "all", meaning no time filter at all."""
+     if cal == "all":
+         return None, None
      if cal != "custom":
          return _bounds_for_calendar(cal)
      start_dt = _parse_local_dt(start_s) if start_s else None
      end_dt   = _parse_local_dt(end_s)   if end_s   else None
-     now_local = datetime.now(_LOCAL_TZ) if _LOCAL_TZ else datetime.now(timezone.utc)
+     now_local = (datetime.now(_LOCAL_TZ) if _LOCAL_TZ else datetime.now(timezone.utc)).replace(tzinfo=None)
      if not end_dt:
          end_dt = now_local.replace(microsecond=0)
      if not start_dt:
@@ -94,17 +143,42 @@ def _bounds_from_request(cal: str, start_s: Optional[str], end_s: Optional[str])
          start_dt, end_dt = end_dt, start_dt
      return _to_utc(start_dt), _to_utc(end_dt)
 
+def _ts_epoch(ts: str, _fromiso=datetime.fromisoformat, _utc=timezone.utc) -> int:
+    """
+    Whole-second UTC epoch of a stored ts ('YYYY-MM-DDTHH:MM:SS[.ffffff]', naive UTC).
+    Only the first 19 chars are parsed; a ' ' date/time separator is swapped for 'T'.
+    """
+    base = ts[:19]
+    if base[10] == " ":
+        base = base[:10] + "T" + base[11:]
+    return int(_fromiso(base).replace(tzinfo=_utc).timestamp())
+
+def _utc_key(iso: str) -> Optional[str]:
+    """Bound -> 'YYYY-MM-DDTHH:MM:SS' in UTC, the form of ts[:19] as the logger writes it."""
+    try:
+        dt = datetime.fromisoformat(iso)
+    except Exception:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S")
+
 def _filter_by_bounds(rows, start_iso: str, end_iso: str):
-    """rows = [(ts, tag, value, unit), ...] — filter by UTC ISO bounds inclusive."""
-    def _to_epoch(ts: str) -> float:
+    """rows = [(ts, tag, value, unit), ...] — filter by UTC ISO bounds inclusive (1 s resolution)."""
+    # Naive-UTC ISO strings sort chronologically, so compare the second-resolution
+    # prefix directly; rows in any other shape take the parsing path below.
+    s_key, e_key = _utc_key(start_iso), _utc_key(end_iso)
+    if s_key and e_key and all(r[0][10:11] == "T" for r in rows):
+        return [r for r in rows if s_key <= r[0][:19] <= e_key]
+
+    def _to_epoch(ts: str) -> int:
         try:
-            dt = datetime.fromisoformat(ts)
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return dt.timestamp()
+            return _ts_epoch(ts)
         except Exception:
-            return -1.0
-    s_ep = _to_epoch(start_iso); e_ep = _to_epoch(end_iso)
+            return -1
+    # bounds may carry an offset, so go through their UTC key rather than ts[:19]
+    s_ep = _to_epoch(s_key) if s_key else -1
+    e_ep = _to_epoch(e_key) if e_key else -1
     out = []
     for ts, tg, val, unit in rows:
         ep = _to_epoch(ts)
@@ -113,7 +187,12 @@ def _filter_by_bounds(rows, start_iso: str, end_iso: str):
     return out
 
 def _bounds_for_calendar(preset: str) -> Tuple[str, str]:
-    now_utc = datetime.now(timezone.utc)
+    # bounds only move once a second; concurrent/polling requests share them
+    return _bounds_at(preset, int(time.time()))
+
+@lru_cache(maxsize=32)
+def _bounds_at(preset: str, now_s: int) -> Tuple[str, str]:
+    now_utc = datetime.fromtimestamp(now_s, tz=timezone.utc)
     now_local = now_utc.astimezone(_LOCAL_TZ) if _LOCAL_TZ else now_utc
     today = now_local.date()
     if preset == "today":
@@ -145,52 +224,128 @@ def _to_iso_utc(dt: datetime) -> str:
         dt = dt.replace(tzinfo=timezone.utc)
     return dt.astimezone(timezone.utc).isoformat()
 
-def _floor_to_bucket(ts: datetime, secs: int) -> datetime:
-    # treat naive as UTC
-    if ts.tzinfo is None:
-        ts = ts.replace(tzinfo=timezone.utc)
-    epoch = int(ts.timestamp())
-    floored = epoch - (epoch % secs)
-    return datetime.fromtimestamp(floored, tz=timezone.utc)
+_NP_BUCKET_MIN = 2000  # rows; below this the dict loop is as fast
+
+def _bucket_np(rows, bucket_s: int):
+    """numpy version of _maybe_bucket (same output); raises ValueError on unparseable ts."""
+    n = len(rows)
+    ts_col, tag_col, val_col, unit_col = zip(*rows)
+    ts = np.array(ts_col, dtype="datetime64[us]").astype(np.int64) // 1_000_000
+    b = ts - ts % bucket_s
+    # None counts as 0, like the loop; a stored NaN stays NaN (float(val) keeps it)
+    vals = np.fromiter((0.0 if v is None else v for v in val_col), dtype=np.float64, count=n)
+    tag_ids = {t: i for i, t in enumerate(dict.fromkeys(tag_col))}
+    tcode = np.fromiter(map(tag_ids.__getitem__, tag_col), dtype=np.int64, count=n)
+    b0 = int(b.min())
+    span = (int(b.max()) - b0) // bucket_s + 1
+    key = tcode * span + (b - b0) // bucket_s
+    _, first, inv = np.unique(key, return_index=True, return_inverse=True)
+    inv = inv.ravel()
+    sums = np.bincount(inv, weights=vals)
+    counts = np.bincount(inv)
+    last = np.zeros(len(sums), dtype=np.intp)
+    np.maximum.at(last, inv, np.arange(n))
+    kb = b[first]
+    # newest bucket first; ties keep first-seen order, like the dict version
+    order = np.lexsort((first, -kb))
+    iso = np.datetime_as_string(kb[order].astype("datetime64[s]"), unit="s")
+    avg = (sums / counts)[order].tolist()
+    return [(f"{i}+00:00", tag_col[f], a, unit_col[l] or "")
+            for i, f, a, l in zip(iso.tolist(), first[order].tolist(), avg, last[order].tolist())]
 
 def _maybe_bucket(rows, bucket_s: int):
     """
     rows: list of tuples (ts_iso, tag, value, unit)
     bucket_s: seconds; returns averaged value per (tag, bucket)
     """
-    from collections import defaultdict
-    acc = defaultdict(lambda: {"sum": 0.0, "n": 0, "unit": ""})
+    if np is not None:
+        if not isinstance(rows, list):
+            rows = list(rows)
+        if len(rows) >= _NP_BUCKET_MIN:
+            try:
+                return _bucket_np(rows, bucket_s)
+            except ValueError:
+                pass  # odd timestamps: the loop below skips them row by row
+    acc = {}  # (tag, bucket_epoch) -> [sum, n, unit]
+    # epoch = (midnight of the date, parsed once per day) + hh:mm:ss by slicing
+    days = {}
+    ts_epoch = _ts_epoch
     for ts_iso, tag, val, unit in rows:
         try:
-            dt = datetime.fromisoformat(ts_iso)
+            day = days.get(ts_iso[:10])
+            if day is None:
+                day = days[ts_iso[:10]] = ts_epoch(ts_iso[:10] + "T00:00:00")
+            ep = day + int(ts_iso[11:13]) * 3600 + int(ts_iso[14:16]) * 60 + int(ts_iso[17:19])
         except Exception:
             continue
-        bts = _floor_to_bucket(dt, bucket_s)
-        key = (tag, bts)
-        acc[key]["sum"] += float(val) if val is not None else 0.0
-        acc[key]["n"]   += 1
-        acc[key]["unit"] = unit or ""
+        key = (tag, ep - ep % bucket_s)
+        a = acc.get(key)
+        if a is None:
+            a = acc[key] = [0.0, 0, ""]
+        a[0] += float(val) if val is not None else 0.0
+        a[1] += 1
+        a[2] = unit or ""
     out = []
-    for (tag, bts), v in acc.items():
-        avg = (v["sum"] / v["n"]) if v["n"] else None
-        out.append((_to_iso_utc(bts), tag, avg, v["unit"]))
+    for (tag, b), (total, n, unit) in acc.items():
+        avg = (total / n) if n else None
+        out.append((_to_iso_utc(datetime.fromtimestamp(b, tz=timezone.utc)), tag, avg, unit))
     # newest first to match your UI
     out.sort(key=lambda r: r[0], reverse=True)
     return out
 
-def download_csv(rows) -> str:
+def _json_response(data):
+    """jsonify() equivalent, encoded with orjson (or ujson) when available."""
+    if orjson is not None:
+        return Response(orjson.dumps(data), mimetype="application/json")
+    if ujson is not None:
+        return Response(ujson.dumps(data, ensure_ascii=False), mimetype="application/json")
+    return jsonify(data)
+
+_CSV_SPECIAL = frozenset(',"\r\n')
+
+def _csv_field(v) -> str:
+    """One field as csv.writer (QUOTE_MINIMAL) would write it."""
+    s = "" if v is None else str(v)
+    if _CSV_SPECIAL.isdisjoint(s):
+        return s
+    return '"' + s.replace('"', '""') + '"'
+
+_CSV_BATCH = 512  # rows per yielded chunk
+
+def iter_csv(rows):
     """
-    rows: iterable of (ts_iso_utc, tag, value, unit)
-    Writes CSV with an extra 'label' column using tag_meta.
+    rows: iterable of (ts_iso_utc, tag, value, unit), e.g. a cursor-backed generator
+    Yields CSV text (header first, alone) with an extra 'label' column using
+    tag_meta, then _CSV_BATCH rows per chunk so large exports never sit in memory.
+    Rows are formatted directly (same output as csv.writer); only the tag/label
+    prefix and odd units need quoting, and the prefix is built once per tag.
     """
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["ts_utc", "tag", "label", "value", "unit"])
-    tmap = _tag_map()  # {tag: {'label','unit'}}
+    # header goes out on its own, before the first query batch is read
+    yield "ts_utc,tag,label,value,unit\r\n"
+    out = []
+    append = out.append
+    prefix = {t: f"{_csv_field(t)},{_csv_field(lbl)}" for t, (lbl, _unit) in _tag_map().items()}
+    special = _CSV_SPECIAL.isdisjoint
     for ts, tg, val, unit in rows:
-        label = tmap.get(tg, {}).get("label", tg)
-        w.writerow([ts, tg, label, "" if val is None else val, unit or ""])
-    return buf.getvalue()
+        p = prefix.get(tg)
+        if p is None:
+            p = prefix[tg] = f"{_csv_field(tg)},{_csv_field(tg)}"
+        if val is None:
+            val = ""
+        if not unit:
+            unit = ""
+        elif not special(unit):
+            unit = _csv_field(unit)
+        append(f"{ts},{p},{val},{unit}\r\n")
+        if len(out) >= _CSV_BATCH:
+            yield "".join(out)
+            out.clear()
+    if out:
+        yield "".join(out)
+
+def download_csv(rows) -> str:
+    """Whole-CSV convenience wrapper around iter_csv()."""
+    return "".join(iter_csv(rows))
 
 # ---------- routes ----------
 
@@ -205,24 +360,30 @@ def api_logs():
 
     start_iso, end_iso = _bounds_from_request(cal, start_s, end_s)
 
-    # Expand fetch a bit when bucketing or custom ranges
-    fetch_limit = limit if bucket_s == 0 and cal != "custom" else max(limit * 4, 2000)
-
-    if HAS_QB:
-        rows = query_logs_between(DB_ROOT, tag=tag, start_iso=start_iso, end_iso=end_iso, limit=fetch_limit)
+    if bucket_s > 0 and HAS_QBUCKET:
+        # averaged in SQLite; no raw-row fetch or Python aggregation
+        rows = query_logs_bucketed(DB_ROOT, tag=tag, start_iso=start_iso, end_iso=end_iso,
+                                   bucket_s=bucket_s, limit=limit)
     else:
-        # Fallback: pull broader and filter server-side
-        base_rows = query_logs(DB_ROOT, tag=tag, cal="all", limit=fetch_limit)
-        rows = _filter_by_bounds(base_rows, start_iso, end_iso)
-
-    if bucket_s > 0:
-        rows = _maybe_bucket(rows, bucket_s)
+        if HAS_QB:
+            # bounds are applied in SQL, so `limit` rows is exactly what's needed
+            # (only Python-side bucketing below wants more raw rows)
+            fetch_limit = limit if bucket_s == 0 else max(limit * 4, 2000)
+            rows = query_logs_between(DB_ROOT, tag=tag, start_iso=start_iso, end_iso=end_iso, limit=fetch_limit)
+        else:
+            # Fallback: pull broader and filter server-side
+            rows = query_logs(DB_ROOT, tag=tag, cal="all", limit=max(limit * 4, 2000))
+            if start_iso is not None:
+                rows = _filter_by_bounds(rows, start_iso, end_iso)
+
+        if bucket_s > 0:
+            rows = _maybe_bucket(rows, bucket_s)
     rows = rows[:limit]
 
-    tmap = {t["name"]: t.get("label", t["name"]) for t in TAGS}
-    data = [{"ts": ts, "tag": tg, "label": tmap.get(tg, tg), "value": val, "unit": unit}
+    label_of = _LABELS.get  # one flat dict lookup per row
+    data = [{"ts": ts, "tag": tg, "label": label_of(tg, tg), "value": val, "unit": unit}
             for (ts, tg, val, unit) in rows]
-    return jsonify(data)
+    return _json_response(data)
 
 @api_bp.route("/download.csv")
 def api_download_csv():
@@ -235,17 +396,21 @@ def api_download_csv():
 
     start_iso, end_iso = _bounds_from_request(cal, start_s, end_s)
 
-    if HAS_QB:
-        rows = query_logs_between(DB_ROOT, tag=tag, start_iso=start_iso, end_iso=end_iso, limit=limit)
+    if bucket_s > 0 and HAS_QBUCKET:
+        # averaged in SQLite: up to `limit` buckets over the whole range
+        rows = query_logs_bucketed(DB_ROOT, tag=tag, start_iso=start_iso, end_iso=end_iso,
+                                   bucket_s=bucket_s, limit=limit)
     else:
-        base_rows = query_logs(DB_ROOT, tag=tag, cal="all", limit=limit*4)
-        rows = _filter_by_bounds(base_rows, start_iso, end_iso)
-
-    if bucket_s > 0:
-        rows = _maybe_bucket(rows, bucket_s)
-
-    csv_text = download_csv(rows)  # your existing helper
-    resp = make_response(csv_text)
-    resp.headers["Content-Type"] = "text/csv"
-    resp.headers["Content-Disposition"] = "attachment; filename=logs.csv"
-    return resp
+        if HAS_QB:
+            # tuples straight off the cursors; only bucketing needs a materialized list
+            rows = iter_logs_between(DB_ROOT, tag=tag, start_iso=start_iso, end_iso=end_iso, limit=limit)
+        else:
+            rows = query_logs(DB_ROOT, tag=tag, cal="all", limit=limit*4)
+            if start_iso is not None:
+                rows = _filter_by_bounds(rows, start_iso, end_iso)
+
+        if bucket_s > 0:
+            rows = _maybe_bucket(rows, bucket_s)
+
+    return Response(stream_with_context(iter_csv(rows)), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment; filename=logs.csv"})
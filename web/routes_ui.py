@@ -1,5 +1,9 @@
 # web/routes_ui.py
-from flask import Blueprint, request, render_template, jsonify, make_response, redirect, url_for
+from flask import (Blueprint, request, render_template, jsonify, make_response, redirect, url_for,
+                   current_app, flash, get_flashed_messages, Response, stream_with_context)
+from markupsafe import Markup, escape
+from functools import lru_cache
+import hashlib, json
 
 from .db import (
     list_tags_with_labels,    # list of {'tag','label'}
@@ -9,159 +13,295 @@ from .db import (
     fmt_local_epoch,
 )
 
-from .storage_status import get_storage_status
+from .storage_status import get_storage_status, iter_storage_status
 
 # New: chunk storage + config (no old DB var)
 from config import DB_ROOT, RETENTION, PLC_IP, PLC_PORT, SLAVE_ID, WORD_ORDER, USE_MODBUS
+try:
+    from config import MODBUS_READ_GAP
+except ImportError:
+    MODBUS_READ_GAP = 8
 
-# Fresh-per-request Modbus
+# Pooled Modbus connections
 from pymodbus.client import ModbusTcpClient
-import struct
+import queue, select, socket, struct, sys, threading, time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 import inspect  # <-- for robust pymodbus 2.x/3.x kwarg detection
 
+try:
+    # optional: decode large setpoint runs in one gather + reinterpret
+    import numpy as np
+except ImportError:
+    np = None
+
 ui_bp = Blueprint("ui", __name__)
 
-# ---------- Modbus helpers (fresh connection, version-compatible) ----------
+# ---------- Modbus helpers (pooled connections, version-compatible) ----------
 
-# Cache which kw the current pymodbus exposes for the "unit/slave" argument.
-# We detect once per process and reuse.
-_UNIT_KW = None  # "unit", "slave", or None if neither (rare)
+# The unit-id kwarg of the installed pymodbus ("device_id" on 3.10+, "slave"
+# on 3.x, "unit" on 2.x) is resolved once at import and baked into the
+# _mb_* helpers below.
+def _detect_unit_kw() -> str | None:
+    try:
+        params = inspect.signature(ModbusTcpClient.read_holding_registers).parameters
+    except (TypeError, ValueError):
+        # Default to "unit" if we can't inspect (most common on 2.x)
+        return "unit"
+    for kw in ("device_id", "slave", "unit"):
+        if kw in params:
+            return kw
+    return None
+
+_UNIT_KW = _detect_unit_kw()
+_UNIT = {_UNIT_KW: SLAVE_ID} if _UNIT_KW else {}
+
+def _tune_socket(c):
+    """Disable Nagle (Modbus PDUs are tiny request/response) and enable TCP keepalive."""
+    sock = getattr(c, "socket", None)
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    except (OSError, AttributeError):
+        pass
 
-def _detect_unit_kw(cli) -> str | None:
+def _socket_idle_ok(cli) -> bool:
     """
-    Inspect read_holding_registers signature to see whether it accepts "unit" or "slave".
-    Returns "unit", "slave", or None. Caches the result in _UNIT_KW.
+    True if an idle client's socket can carry the next request. is_socket_open()
+    only checks that a socket object exists; an idle socket that is readable has
+    either been closed by the PLC (EOF) or holds a late reply to an earlier,
+    timed-out request, and reusing it would fail mid-read or pair the next
+    request with the wrong response.
     """
-    global _UNIT_KW
-    if _UNIT_KW is not None:
-        return _UNIT_KW
+    sock = getattr(cli, "socket", None)
+    if sock is None:
+        return False
     try:
-        sig = inspect.signature(cli.read_holding_registers)
-        params = sig.parameters
-        if "unit" in params:
-            _UNIT_KW = "unit"
-        elif "slave" in params:
-            _UNIT_KW = "slave"
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
+
+# Idle connected clients, most recently used first. A client is owned by one
+# request while checked out, so no per-client locking is needed.
+_MB_POOL = queue.LifoQueue(maxsize=4)
+
+# Reconnect backoff: after a failed connect, further connects are refused
+# locally (no TCP handshake, no 2 s timeout) until _retry_at; the delay doubles
+# from _BACKOFF_MIN up to _BACKOFF_MAX and resets on the next good connect.
+_BACKOFF_MIN, _BACKOFF_MAX = 0.5, 5.0
+# Connects are serialized: a request that queued behind a failing connect
+# re-checks the backoff and fails at once instead of timing out again.
+_connect_lock = threading.Lock()
+_backoff = 0.0
+_retry_at = 0.0
+
+def _connect(cli) -> bool:
+    """cli.connect() unless in reconnect backoff; tunes the socket on success."""
+    global _backoff, _retry_at
+    if time.monotonic() < _retry_at:
+        return False
+    with _connect_lock:
+        if time.monotonic() < _retry_at:
+            return False
+        ok = cli.connect()
+        if ok:
+            _backoff, _retry_at = 0.0, 0.0
         else:
-            _UNIT_KW = None
-    except Exception:
-        # Default to "unit" if we can't inspect (most common on 2.x)
-        _UNIT_KW = "unit"
-    return _UNIT_KW
+            _backoff = min(_BACKOFF_MAX, _backoff * 2) if _backoff else _BACKOFF_MIN
+            _retry_at = time.monotonic() + _backoff
+    if ok:
+        _tune_socket(cli)
+    return ok
+
+def _checkout_client():
+    """
+    A connected client: a pooled one if its socket is still open, else a new
+    one. Dead pooled clients are closed, not reconnected, so a PLC outage
+    costs one connect attempt per request (none while in backoff).
+    """
+    while True:
+        try:
+            cli = _MB_POOL.get_nowait()
+        except queue.Empty:
+            break
+        if _socket_idle_ok(cli):
+            return cli
+        try: cli.close()
+        except Exception: pass
+    cli = ModbusTcpClient(host=PLC_IP, port=PLC_PORT, timeout=2)
+    if not _connect(cli):
+        cli.close()
+        return None
+    return cli
 
 def _with_modbus(op):
     """
-    Open a new Modbus TCP connection, run op(cli), then close.
+    Run op(cli) on a pooled Modbus TCP connection (opened on demand).
     Returns (result, error_msg). If op itself returns (result, error_msg),
-    we pass that through without nesting.
+    we pass that through without nesting. A client that raised is closed
+    rather than returned to the pool.
     """
     if not USE_MODBUS:
         return None, "Modbus not enabled on server"
 
-    cli = ModbusTcpClient(host=PLC_IP, port=PLC_PORT, timeout=2)
+    cli = _checkout_client()
+    if cli is None:
+        return None, "Modbus connect failed"
     try:
-        if not cli.connect():
-            return None, "Modbus connect failed"
-
-        # Prime detection (once)
-        _detect_unit_kw(cli)
-
         rv = op(cli)
-
-        # If op already returned (result, err), pass it through unchanged.
-        if isinstance(rv, tuple) and len(rv) == 2 and isinstance(rv[1], (str, type(None))):
-            return rv
-
-        # Otherwise, wrap as (result, "")
-        return rv, ""
     except Exception as e:
+        try: cli.close()
+        except Exception: pass
         return None, str(e)
-    finally:
-        try:
-            cli.close()
-        except Exception:
-            pass
+    try:
+        _MB_POOL.put_nowait(cli)
+    except queue.Full:
+        cli.close()
+
+    # If op already returned (result, err), pass it through unchanged.
+    if isinstance(rv, tuple) and len(rv) == 2 and isinstance(rv[1], (str, type(None))):
+        return rv
 
-def _apply_unit_kw(kwargs: dict, kw: str | None) -> dict:
-    """Return a copy of kwargs with the correct unit/slave kw injected if available."""
-    if kw:
-        out = dict(kwargs)
-        out[kw] = SLAVE_ID
-        return out
-    return kwargs
+    # Otherwise, wrap as (result, "")
+    return rv, ""
 
+# Every response pymodbus returns (>= 3.5, see requirements.txt) has
+# isError(), so callers check it directly.
 def _mb_read_holding(cli, address: int, count: int):
-    """Compat wrapper for pymodbus 2.x (unit=) vs 3.x (slave=) with fallback."""
-    kw = _detect_unit_kw(cli)
-    base = dict(address=address, count=count)
-    try:
-        return cli.read_holding_registers(**_apply_unit_kw(base, kw))
-    except TypeError:
-        # Try the alternate kw once (covers weird installs)
-        alt = "slave" if kw == "unit" else "unit"
-        try:
-            return cli.read_holding_registers(**_apply_unit_kw(base, alt))
-        except TypeError:
-            # Last resort: call without either kw
-            return cli.read_holding_registers(**base)
+    return cli.read_holding_registers(address=address, count=count, **_UNIT)
 
 def _mb_write_register(cli, address: int, value: int):
-    kw = _detect_unit_kw(cli)
-    base = dict(address=address, value=value)
-    try:
-        return cli.write_register(**_apply_unit_kw(base, kw))
-    except TypeError:
-        alt = "slave" if kw == "unit" else "unit"
-        try:
-            return cli.write_register(**_apply_unit_kw(base, alt))
-        except TypeError:
-            return cli.write_register(**base)
+    return cli.write_register(address=address, value=value, **_UNIT)
 
 def _mb_write_registers(cli, address: int, values):
-    kw = _detect_unit_kw(cli)
-    base = dict(address=address, values=values)
-    try:
-        return cli.write_registers(**_apply_unit_kw(base, kw))
-    except TypeError:
-        alt = "slave" if kw == "unit" else "unit"
-        try:
-            return cli.write_registers(**_apply_unit_kw(base, alt))
-        except TypeError:
-            return cli.write_registers(**base)
-
+    return cli.write_registers(address=address, values=values, **_UNIT)
+
+# WORD_ORDER is fixed per process, so the float32 <-> word-pair codecs are
+# compiled once. With "<" (LH) the little-endian pair comes out already
+# swapped (low word first), so neither direction needs a Python-level swap.
+_SP_BO = "<" if WORD_ORDER.upper() == "LH" else ">"
+_F32, _WORDS = struct.Struct(_SP_BO + "f"), struct.Struct(_SP_BO + "HH")
+_f32_pack, _f32_unpack = _F32.pack, _F32.unpack
+_words_pack, _words_unpack = _WORDS.pack, _WORDS.unpack
+
+# Memoized: writes and the per-setpoint read fallback keep converting the
+# same few values, and WORD_ORDER is fixed per process.
+@lru_cache(maxsize=256)
 def _float_to_words(val: float):
     """Encode float32 to two 16-bit words with WORD_ORDER ('HL' or 'LH')."""
-    hi, lo = struct.unpack(">HH", struct.pack(">f", float(val)))
-    if WORD_ORDER.upper() == "LH":
-        hi, lo = lo, hi
-    return int(hi), int(lo)
+    return _words_unpack(_f32_pack(float(val)))
 
+@lru_cache(maxsize=512)
 def _words_to_float(hi: int, lo: int) -> float:
-    """Decode two 16-bit words to float32 with WORD_ORDER."""
-    if WORD_ORDER.upper() == "LH":
-        hi, lo = lo, hi
-    return struct.unpack(">f", struct.pack(">HH", int(hi), int(lo)))[0]
+    """Decode two 16-bit words (in WORD_ORDER) to float32."""
+    return _f32_unpack(_words_pack(int(hi), int(lo)))[0]
+
+# Window decode: registers are packed into one buffer in _SP_BO, and one
+# precompiled Struct pulls every setpoint out of it, skipping the gaps.
+_MAX_WINDOW = 125  # Modbus limit for a single read_holding_registers
+_NP_MIN_ITEMS = 16  # setpoints per run below which the run's Struct is as fast
+_SP_SWAP = (sys.byteorder == "little") != (_SP_BO == "<")
+
+@lru_cache(maxsize=8)
+def _setpoint_runs(layout: tuple):
+    """
+    layout: ((name, mw, dtype), ...). Groups setpoints (by address) into runs
+    that are each fetched with one read: a gap of up to MODBUS_READ_GAP unused
+    registers is read through rather than paying another round trip.
+    Returns ((start, count, unpack, names, np_plan), ...), or None if setpoints
+    overlap. np_plan is set for runs of _NP_MIN_ITEMS or more when numpy is
+    available (see _decode_run_np).
+    """
+    runs, cur = [], None  # cur = [start, pos, fmt, names, [(name, offset, width)]]
+    for name, mw, dtype in sorted(layout, key=lambda x: x[1]):
+        width = 1 if dtype == "INT16" else 2
+        if cur is not None and mw < cur[1]:
+            return None
+        if cur is None or mw - cur[1] > MODBUS_READ_GAP or mw + width - cur[0] > _MAX_WINDOW:
+            cur = [mw, mw, [_SP_BO], [], []]
+            runs.append(cur)
+        if mw > cur[1]:
+            cur[2].append(f"{2 * (mw - cur[1])}x")
+        cur[2].append("H" if width == 1 else "f")
+        cur[1] = mw + width
+        cur[3].append(name)
+        cur[4].append((name, mw - cur[0], width))
+    return tuple((start, pos - start, struct.Struct("".join(fmt)).unpack, tuple(names),
+                  _np_plan(items) if np is not None and len(items) >= _NP_MIN_ITEMS else None)
+                 for start, pos, fmt, names, items in runs)
+
+def _np_plan(items):
+    """(int16 names, their word offsets, float names, their word-pair offsets)."""
+    ints = [(n, o) for n, o, w in items if w == 1]
+    flts = [(n, o) for n, o, w in items if w == 2]
+    return (tuple(n for n, _ in ints), np.array([o for _, o in ints], dtype=np.intp),
+            tuple(n for n, _ in flts),
+            np.array([(o, o + 1) for _, o in flts], dtype=np.intp).reshape(-1))
+
+def _decode_run_np(buf: bytes, plan):
+    """
+    Decode a run buffer (registers in _SP_BO) with numpy: INT16 words are
+    gathered directly, FLOAT32 word pairs are gathered into one contiguous
+    buffer and reinterpreted as float32. Same values as the run's Struct.
+    """
+    int_names, int_offs, flt_names, flt_offs = plan
+    words = np.frombuffer(buf, dtype=_SP_BO + "u2")
+    out = dict(zip(int_names, words[int_offs].tolist()))
+    flts = np.frombuffer(words[flt_offs].tobytes(), dtype=_SP_BO + "f4")
+    out.update(zip(flt_names, flts.tolist()))
+    return out
+
+def _layout(sps) -> tuple:
+    return tuple((sp.get("name"), int(sp.get("mw")), sp.get("dtype")) for sp in sps)
+
+# fetch_setpoints() is built once per process, so its layout is too
+_SP_ROWS = fetch_setpoints()
+_SP_LAYOUT = _layout(_SP_ROWS)
 
 def _read_setpoints_values(cli, sps):
     """
-    Read current values for each setpoint in sps.
-    sps items: {'name','mw','dtype', ...}
+    Read current values for each setpoint in sps, one read per run from
+    _setpoint_runs; if a run read fails, the setpoints not yet read are
+    fetched individually.
+    sps items: {'name','mw','dtype', ...} as from fetch_setpoints() (dtype upper-cased)
     Returns (values_dict, error_msg)
     """
+    layout = _SP_LAYOUT if sps is _SP_ROWS else _layout(sps)
+    runs = _setpoint_runs(layout)
     values = {}
-    for sp in sps:
-        name = sp.get("name")
-        addr = int(sp.get("mw"))
-        dtype = (sp.get("dtype") or "INT16").upper()
+    for start, count, unpack, names, np_plan in runs or ():
+        try:
+            rr = _mb_read_holding(cli, address=start, count=count)
+            if rr is None or rr.isError():
+                # e.g. an unmapped register in a gap: read the rest one by one
+                break
+            a = array("H", rr.registers[:count])
+            if _SP_SWAP:
+                a.byteswap()
+            buf = a.tobytes()
+            values.update(_decode_run_np(buf, np_plan) if np_plan is not None
+                          else zip(names, unpack(buf)))
+        except Exception:
+            break
+    else:
+        if runs is not None:
+            return values, ""
+
+    for name, addr, dtype in layout:
+        if name in values:
+            continue
         try:
             if dtype == "INT16":
                 rr = _mb_read_holding(cli, address=addr, count=1)
-                if rr is None or (hasattr(rr, "isError") and rr.isError()):
+                if rr is None or rr.isError():
                     return values, f"Read error @%MW{addr}: {getattr(rr, 'exception_code', rr)}"
                 values[name] = int(rr.registers[0])
             else:
                 rr = _mb_read_holding(cli, address=addr, count=2)
-                if rr is None or (hasattr(rr, "isError") and rr.isError()):
+                if rr is None or rr.isError():
                     return values, f"Read error @%MW{addr}..{addr+1}: {getattr(rr, 'exception_code', rr)}"
                 hi, lo = rr.registers[0], rr.registers[1]
                 values[name] = _words_to_float(hi, lo)
@@ -169,36 +309,194 @@ def _read_setpoints_values(cli, sps):
             return values, f"Read exception @%MW{addr}: {e}"
     return values, ""
 
+def _make_writer(sp):
+    """Specialize the write for one setpoint: address and encoding are fixed per name."""
+    addr = int(sp["mw"])
+    if sp["dtype"] == "INT16":
+        return lambda cli, v: _mb_write_register(cli, address=addr, value=int(v))
+    return lambda cli, v: _mb_write_registers(cli, address=addr, values=list(_float_to_words(v)))
+
+# setpoint name -> (row, writer); the setpoint table is static for the process
+_SP_WRITERS = {sp["name"]: (sp, _make_writer(sp)) for sp in fetch_setpoints()}
+
+# ---------- Setpoint poller (persistent connection) ----------
+# A background thread keeps one client connected and re-reads the setpoint
+# window every _SP_POLL_S while someone has the page open, so GET /setpoints
+# is served from memory instead of paying a TCP connect + read. Writes still
+# go through _with_modbus, invalidate the snapshot and queue a re-read.
+
+_SP_POLL_S = 1.5     # poll period while the page is in use
+_SP_MAX_AGE = 5.0    # older snapshots are ignored (read live instead)
+_SP_IDLE_S = 60.0    # stop polling (and drop the connection) after this long unviewed
+
+_sp_lock = threading.Lock()
+_sp_snapshot = (0.0, None)  # (monotonic time, values dict)
+_sp_gen = 0                 # bumped on every write; stale reads are discarded
+_sp_viewed = 0.0
+_sp_thread = None
+# After a write, the re-read runs here while the browser follows the redirect,
+# so the GET it lands on usually finds the values already in flight.
+_SP_EXEC = ThreadPoolExecutor(max_workers=1, thread_name_prefix="setpoint-refresh")
+_sp_refresh = None          # Future of the latest post-write re-read
+
+def _sp_pump():
+    global _sp_snapshot
+    cli = None
+    while True:
+        if time.monotonic() - _sp_viewed > _SP_IDLE_S:
+            if cli is not None:
+                try: cli.close()
+                except Exception: pass
+                cli = None
+            time.sleep(_SP_POLL_S)
+            continue
+        try:
+            if cli is None:
+                cli = ModbusTcpClient(host=PLC_IP, port=PLC_PORT, timeout=2)
+            if not cli.connected and not _connect(cli):
+                raise ConnectionError("Modbus connect failed")
+            gen = _sp_gen
+            values, err = _read_setpoints_values(cli, fetch_setpoints())
+            if err:
+                raise RuntimeError(err)
+            with _sp_lock:
+                if gen == _sp_gen:
+                    _sp_snapshot = (time.monotonic(), values)
+        except Exception:
+            # reconnect on the next round; GET falls back to a live read meanwhile
+            if cli is not None:
+                try: cli.close()
+                except Exception: pass
+            cli = None
+        time.sleep(_SP_POLL_S)
+
+def _setpoint_values(sps):
+    """(values, err) for the page: the poller's snapshot if fresh, else a live read."""
+    global _sp_viewed, _sp_thread
+    _sp_viewed = time.monotonic()
+    if USE_MODBUS and _sp_thread is None:
+        with _sp_lock:
+            if _sp_thread is None:
+                _sp_thread = threading.Thread(target=_sp_pump, name="setpoint-poller", daemon=True)
+                _sp_thread.start()
+    ts, values = _sp_snapshot
+    if values is not None and time.monotonic() - ts <= _SP_MAX_AGE:
+        return dict(values), ""
+    fut = _sp_refresh
+    if fut is not None and not fut.done() and sps is _SP_ROWS:
+        # a post-write re-read is in flight: wait for it rather than read twice
+        values, err = fut.result()
+        if not err:
+            return dict(values), ""
+    return _with_modbus(lambda cli: _read_setpoints_values(cli, sps))
+
+def _refresh_setpoint_values():
+    global _sp_snapshot
+    gen = _sp_gen
+    values, err = _with_modbus(lambda cli: _read_setpoints_values(cli, _SP_ROWS))
+    if not err:
+        with _sp_lock:
+            if gen == _sp_gen:
+                _sp_snapshot = (time.monotonic(), values)
+    return values, err
+
+def _invalidate_setpoint_values():
+    global _sp_snapshot, _sp_gen, _sp_refresh
+    with _sp_lock:
+        _sp_gen += 1
+        _sp_snapshot = (0.0, None)
+        _sp_refresh = _SP_EXEC.submit(_refresh_setpoint_values) if USE_MODBUS else None
+
 # ---------- Routes ----------
 
+# Tag list for the home page selector; tags.py is static for the process
+# lifetime, so only the selections vary per request.
+_HOME_TAGS = list_tags_with_labels()  # [{'tag','label'}]
+_HOME_TAG_SET = frozenset(r["tag"] for r in _HOME_TAGS)
+
+@lru_cache(maxsize=None)  # keyed by known tag names (or "") only
+def _tag_options_html(selected: str) -> Markup:
+    """Pre-rendered <option> list for the tag selector, with `selected` marked."""
+    return Markup("".join(
+        f'<option value="{escape(r["tag"])}"{" selected" if r["tag"] == selected else ""}>'
+        f'{escape(r["label"])}</option>'
+        for r in _HOME_TAGS))
+
+# The page is a function of the query string and inputs that are fixed per
+# deployment: the templates, the tag list, the configured zone and the
+# (content-hashed) stylesheet URL. Its ETag hashes exactly those, so every
+# worker, and a restarted one, answers a revalidation with the same tag.
+_home_etag_base = None
+
+def _home_etag_seed() -> bytes:
+    global _home_etag_base
+    if _home_etag_base is None:
+        env = current_app.jinja_env
+        parts = [env.loader.get_source(env, name)[0] for name in ("base.html", "home.html")]
+        parts += [repr(_HOME_TAGS), str(env.globals.get("CONFIG_LOCAL_TZ")),
+                  url_for("static", filename="bootstrap.min.css")]
+        _home_etag_base = hashlib.blake2b("\0".join(parts).encode(), digest_size=8).digest()
+    return _home_etag_base
+
 @ui_bp.route("/")
 def home():
+    etag = hashlib.blake2b(_home_etag_seed() + request.query_string, digest_size=8).hexdigest()
+    # Flask-Compress sends compressed variants as "<etag>:gzip" etc.
+    for tag in request.if_none_match:
+        if tag.partition(":")[0] == etag:
+            return "", 304, {"ETag": f'"{tag}"'}
+
     cur_tag    = request.args.get("tag", "").strip()
     cur_limit  = request.args.get("limit", "500")
     cur_bucket = request.args.get("bucket_s", "")
     cur_cal    = request.args.get("cal", "all").strip().lower()
 
-    tags = list_tags_with_labels()  # [{'tag','label'}]
+    tags = _HOME_TAGS
+    tag_options = _tag_options_html(cur_tag if cur_tag in _HOME_TAG_SET else "")
     selections = {
         "tag": cur_tag,
         "limit": cur_limit,
         "bucket_s": cur_bucket,
         "cal": cur_cal,
     }
-    return render_template("home.html", title="PLC Logger UI",
-                           tags=tags, selections=selections)
-
-@ui_bp.route("/status_page")
-def status_page():
+    resp = make_response(render_template("home.html", title="PLC Logger UI",
+                                         tags=tags, tag_options=tag_options, selections=selections))
+    resp.set_etag(etag)
+    resp.cache_control.max_age = 30
+    return resp
+
+def _runtime_state():
+    """Logger state (cached in db.read_state) plus local-time renderings."""
     s = read_state()
     if s.get("last_read_epoch") is not None:
         s["last_read_epoch_local"] = fmt_local_epoch(s.get("last_read_epoch"))
     if s.get("last_flush_epoch") is not None:
         s["last_flush_epoch_local"] = fmt_local_epoch(s.get("last_flush_epoch"))
+    return s
+
+@ui_bp.route("/status")
+def status_json():
+    storage = get_storage_status(DB_ROOT, RETENTION.get("total_cap_mb", 0),
+                                 full=request.args.get("full") == "1")
+    return jsonify({"state": _runtime_state(), "storage": storage})
+
+@ui_bp.route("/status/storage.ndjson")
+def status_storage_stream():
+    """Storage status as newline-delimited JSON: one line per family as it is
+    summed, then the full summary (same shape as /status "storage")."""
+    it = iter_storage_status(DB_ROOT, RETENTION.get("total_cap_mb", 0),
+                             full=request.args.get("full") == "1")
+    return Response(stream_with_context(json.dumps(item) + "\n" for item in it),
+                    mimetype="application/x-ndjson")
+
+@ui_bp.route("/status_page")
+def status_page():
+    s = _runtime_state()
 
     # Use chunk root + total cap (MB), and pass per-family caps too
     total_cap_mb = RETENTION.get("total_cap_mb", 0)
-    storage = get_storage_status(DB_ROOT, total_cap_mb)
+    # without a cap there's no % to show, so the per-family walk is opt-in (?full=1)
+    storage = get_storage_status(DB_ROOT, total_cap_mb, full=request.args.get("full") == "1")
     family_caps = RETENTION.get("caps", {})  # e.g. {"conditional":7000, ...}
 
     return render_template("status.html",
@@ -212,7 +510,8 @@ def setpoints():
     # carry selection across requests
     selected_name = (request.args.get("sel") or "").strip()
 
-    msg = request.args.get("m", "")  # message carried via redirect
+    # message carried across the redirect: flashed if sessions are set up, else ?m=
+    msg = request.args.get("m", "") or next(iter(get_flashed_messages()), "")
     labels = tag_label_map()
     sps = fetch_setpoints()  # list of dicts describing setpoints
 
@@ -223,9 +522,14 @@ def setpoints():
 
     # POST (write) — do the write, then redirect back with ?sel=<name>&m=<msg>
     if request.method == "POST":
-        name = (request.form.get("name") or (request.json or {}).get("name") or "").strip()
-        value = (request.form.get("value") or (request.json or {}).get("value") or "").strip()
-        sp = next((x for x in sps if x.get("name") == name), None)
+        # only a JSON request body is parsed as JSON (is_json is a header check)
+        form = request.form
+        body = request.get_json(silent=True) if request.is_json else None
+        if not isinstance(body, dict):
+            body = {}
+        name = str(form.get("name") or body.get("name") or "").strip()
+        value = str(form.get("value") or body.get("value") or "").strip()
+        sp, writer = _SP_WRITERS.get(name, (None, None))
         selected_name = name or selected_name or sps[0]["name"]  # keep current selection
 
         try:
@@ -233,35 +537,39 @@ def setpoints():
         except Exception:
             fval = None
 
+        def _back(msg, **args):
+            # 303: reloading the page we land on re-GETs rather than re-POSTs
+            if current_app.secret_key:
+                flash(msg)
+                return redirect(url_for("ui.setpoints", sel=selected_name, **args), code=303)
+            return redirect(url_for("ui.setpoints", sel=selected_name, m=msg, **args), code=303)
+
         if not sp or fval is None:
-            msg = "Invalid name or value"
-        else:
-            def _write(cli):
-                addr = int(sp["mw"])
-                dtype = (sp.get("dtype") or "INT16").upper()
-                if dtype == "INT16":
-                    rq = _mb_write_register(cli, address=addr, value=int(fval))
-                else:
-                    hi, lo = _float_to_words(fval)
-                    rq = _mb_write_registers(cli, address=addr, values=[hi, lo])
-                if hasattr(rq, "isError") and rq.isError():
-                    raise RuntimeError(f"Modbus write error: {rq}")
-                return True
-
-            ok, err = _with_modbus(lambda cli: _write(cli))
-            pretty = labels.get(name, sp.get("label") or name)
-            msg = f"Updated {pretty}" if (err == "" and ok) else f"Write failed for {pretty}: {err or 'unknown error'}"
-
-        # Redirect so the page reload keeps the selection and shows the message
-        return redirect(url_for("ui.setpoints", sel=selected_name, m=msg))
+            # nothing was written: keep=1 lets the GET reuse the last values seen
+            return _back("Invalid name or value", keep=1)
+
+        def _write(cli):
+            rq = writer(cli, fval)
+            if rq.isError():
+                raise RuntimeError(f"Modbus write error: {rq}")
+            return True
+
+        ok, err = _with_modbus(lambda cli: _write(cli))
+        _invalidate_setpoint_values()
+        pretty = labels.get(name, sp.get("label") or name)
+        msg = f"Updated {pretty}" if (err == "" and ok) else f"Write failed for {pretty}: {err or 'unknown error'}"
+
+        return _back(msg)
 
     # GET — read current values and render
     # if no selected_name yet (first load), default to first
     if not selected_name:
         selected_name = sps[0]["name"]
 
-    # Always read fresh values (GET or after POST)
-    values, err = _with_modbus(lambda cli: _read_setpoints_values(cli, sps))
+    # Poller snapshot (at most _SP_MAX_AGE old, never older than the last write);
+    # after a rejected POST (keep=1) any snapshot will do, as nothing changed
+    snap = _sp_snapshot[1] if request.args.get("keep") else None
+    values, err = (dict(snap), "") if snap is not None else _setpoint_values(sps)
     values = values or {}
 
     if err and not msg:
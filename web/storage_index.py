@@ -0,0 +1,144 @@
+# web/storage_index.py
+# In-memory {path: size} index of the chunk tree, kept current by filesystem
+# notifications, so storage status sums sizes from RAM instead of stat()ing
+# every chunk file per request. Opt-in (config STORAGE_INDEX) and needs
+# watchdog; otherwise (or until the initial walk finishes) storage_status walks
+# the tree as before, behind its 5 s cache.
+import os
+import stat
+import threading
+from typing import Dict, Optional, Tuple
+
+try:
+    # optional: pip install watchdog
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except Exception:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class StorageIndex(FileSystemEventHandler):
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.ready = False               # True once the seeding walk is merged
+        self._sizes: Dict[str, Optional[int]] = {}  # None = deleted while seeding
+        self._lock = threading.Lock()
+        self._observer = None
+
+    def start(self) -> bool:
+        """Watch root, then seed from a full walk in the background."""
+        if Observer is None or not os.path.isdir(self.root):
+            return False
+        obs = Observer()
+        obs.schedule(self, self.root, recursive=True)
+        obs.daemon = True
+        obs.start()  # before the walk, so no change falls between the two
+        self._observer = obs
+        threading.Thread(target=self._seed, name="storage-index-seed", daemon=True).start()
+        return True
+
+    @staticmethod
+    def _walk(top: str) -> Dict[str, int]:
+        found: Dict[str, int] = {}
+        stack = [top]
+        while stack:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with it:
+                for e in it:
+                    try:
+                        if e.is_dir(follow_symlinks=False):
+                            stack.append(e.path)
+                        elif e.is_file(follow_symlinks=False):
+                            found[e.path] = e.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        pass
+        return found
+
+    def _seed(self):
+        found = self._walk(self.root)
+        with self._lock:
+            # events seen during the walk are newer than what it found
+            found.update(self._sizes)
+            self._sizes = {p: s for p, s in found.items() if s is not None}
+            self.ready = True
+
+    def _refresh(self, path: str):
+        try:
+            st = os.lstat(path)
+            size = st.st_size if stat.S_ISREG(st.st_mode) else None
+        except OSError:
+            size = None
+        with self._lock:
+            if size is not None or not self.ready:
+                self._sizes[path] = size
+            else:
+                self._sizes.pop(path, None)
+
+    def _drop_tree(self, top: str):
+        prefix = top + os.sep
+        with self._lock:
+            for p in [p for p in self._sizes if p.startswith(prefix)]:
+                if self.ready:
+                    del self._sizes[p]
+                else:
+                    self._sizes[p] = None
+
+    # watchdog callbacks (observer thread)
+    def on_created(self, event):
+        if not event.is_directory:
+            self._refresh(event.src_path)
+
+    on_modified = on_created
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            self._drop_tree(event.src_path)
+        else:
+            self._refresh(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            self._drop_tree(event.src_path)
+            for p in self._walk(event.dest_path):
+                self._refresh(p)
+        else:
+            self._refresh(event.src_path)
+            self._refresh(event.dest_path)
+
+    def sum_under(self, path: str) -> Tuple[int, int]:
+        """(bytes, files) under path, from the index; same result as _sum_files_under."""
+        prefix = os.path.abspath(path) + os.sep
+        with self._lock:
+            items = list(self._sizes.items())  # C-level copy; filter outside the lock
+        sizes = [s for p, s in items if p.startswith(prefix)]
+        return sum(sizes), len(sizes)
+
+
+_INDEX: Optional[StorageIndex] = None
+
+
+def start_storage_index(root: str) -> bool:
+    """Start the process-wide index for root (once). False if watchdog is missing."""
+    global _INDEX
+    if _INDEX is not None:
+        return True
+    idx = StorageIndex(root)
+    if not idx.start():
+        return False
+    _INDEX = idx
+    return True
+
+
+def index_for(path: str) -> Optional[StorageIndex]:
+    """The running index if it is seeded and covers path, else None."""
+    idx = _INDEX
+    if idx is None or not idx.ready:
+        return None
+    p = os.path.abspath(path)
+    if p == idx.root or p.startswith(idx.root + os.sep):
+        return idx
+    return None
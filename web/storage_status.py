@@ -1,84 +1,278 @@
 # web/storage_status.py
 import os
-from typing import Dict, Any, Tuple
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Iterator, Tuple
+
+from .storage_index import index_for
 
 MB = 1024 * 1024
 
+try:
+    # "chunks" (DB_ROOT/chunks/<family>) or "flat" (DB_ROOT/<family>); skips layout probing
+    from config import DB_LAYOUT
+except Exception:
+    DB_LAYOUT = None
+
+try:
+    # False: estimate rotated chunks at chunk_max_mb instead of stat()ing them
+    from config import EXACT_SIZES, RETENTION
+    _CHUNK_BYTES = int(RETENTION.get("chunk_max_mb", 0)) * MB
+except Exception:
+    EXACT_SIZES, _CHUNK_BYTES = True, 0
+
+_STATUS_TTL = 5.0                   # seconds a storage walk is served
+_STATUS = (0.0, None, None)         # (monotonic expiry, key, status dict)
+_STATUS_LOCK = threading.Lock()
+
 def _sum_files_under(path: str) -> Tuple[int, int]:
+    """(bytes, files) under path, via scandir so each file costs one lstat at most."""
     total, count = 0, 0
-    if not os.path.isdir(path):
+    stack = [path]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.is_file(follow_symlinks=False):
+                        total += e.stat(follow_symlinks=False).st_size
+                        count += 1
+                except OSError:
+                    pass
+    return total, count
+
+def _estimate_files_under(path: str) -> Tuple[int, int]:
+    """
+    (bytes, files) for a chunk family dir, stat()ing only the active chunk:
+    rotated chunks (every .db but the newest by name, as chunks.list_chunks
+    orders them) are counted at _CHUNK_BYTES, the size they rotate at. Other
+    files (-wal/-shm sidecars) are stat'ed. Dirs with subdirectories aren't
+    a chunk family, so they get the exact walk.
+    """
+    dbs, total, count = [], 0, 0
+    try:
+        it = os.scandir(path)
+    except OSError:
         return 0, 0
-    for root, _dirs, files in os.walk(path):
-        for fn in files:
-            fp = os.path.join(root, fn)
+    with it:
+        for e in it:
             try:
-                total += os.path.getsize(fp)
+                if e.is_dir(follow_symlinks=False):
+                    return _sum_files_under(path)
+                if not e.is_file(follow_symlinks=False):
+                    continue
                 count += 1
+                if e.name.endswith(".db"):
+                    dbs.append(e)
+                else:
+                    total += e.stat(follow_symlinks=False).st_size
             except OSError:
                 pass
+    if dbs:
+        newest = max(dbs, key=lambda e: e.name)
+        total += (len(dbs) - 1) * _CHUNK_BYTES
+        try:
+            total += newest.stat(follow_symlinks=False).st_size
+        except OSError:
+            pass
     return total, count
 
-def _family_stats(path: str, name: str) -> Dict[str, Any]:
-    bytes_, files_ = _sum_files_under(os.path.join(path, name))
-    return {"name": name, "bytes": bytes_, "mb": round(bytes_ / MB, 1), "files": files_}
+def _fs_usage(db_root: str) -> Dict[str, Any]:
+    """Total/used/free MB of the volume holding db_root (one statvfs)."""
+    try:
+        du = shutil.disk_usage(db_root)
+    except OSError:
+        return {"fs_total_mb": None, "fs_used_mb": None, "fs_free_mb": None}
+    return {"fs_total_mb": round(du.total / MB, 1), "fs_used_mb": round(du.used / MB, 1),
+            "fs_free_mb": round(du.free / MB, 1)}
+
+def _fs_summary(db_root: str, max_total_mb: int) -> Dict[str, Any]:
+    """Filesystem totals only; the chunk tree isn't walked."""
+    return {
+        "root": db_root,
+        "summary_only": True,  # per-family rollups skipped; pass full=True for them
+        "total_mb": None,
+        "cap_mb": float(max_total_mb or 0),
+        "pct_of_cap": 0.0,
+        "files_total": None,
+        "families": {},
+        **_fs_usage(db_root),
+    }
+
+def get_storage_status(db_root: str, max_total_mb: int, full: bool = True) -> Dict[str, Any]:
+    """
+    Storage summary for db_root, cached for _STATUS_TTL so refreshes and
+    concurrent viewers share one directory walk. Treat the result as read-only.
+    With no cap configured and full=False, only filesystem totals are
+    returned (see _fs_summary) and the chunk tree isn't walked.
+    """
+    global _STATUS
+    if not max_total_mb and not full:
+        return _fs_summary(db_root, max_total_mb)
+    key = (db_root, max_total_mb)
+    exp, k, val = _STATUS
+    if k == key and time.monotonic() < exp:
+        return val
+    with _STATUS_LOCK:
+        # another thread may have walked while we waited
+        exp, k, val = _STATUS
+        now = time.monotonic()
+        if k != key or now >= exp:
+            val = _storage_status(db_root, max_total_mb)
+            _STATUS = (now + _STATUS_TTL, key, val)
+    return val
 
-def get_storage_status(db_root: str, max_total_mb: int) -> Dict[str, Any]:
+def iter_storage_status(db_root: str, max_total_mb: int, full: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming form of get_storage_status(): yields {"family", "mb", "files"}
+    for each family as soon as it is summed, then the same dict
+    get_storage_status() returns. A fresh cached status is replayed instead
+    of walking. A walk runs on its own thread under _STATUS_LOCK and hands
+    items over a queue, so a slow client never holds the lock; the walk
+    finishes (and refreshes the cache) even if the client goes away.
     """
-    Supports either:
+    if not max_total_mb and not full:
+        yield _fs_summary(db_root, max_total_mb)
+        return
+    key = (db_root, max_total_mb)
+    exp, k, val = _STATUS
+    if k != key or time.monotonic() >= exp:
+        items: "queue.Queue" = queue.Queue()
+        threading.Thread(target=_walk_into, args=(key, db_root, max_total_mb, items),
+                         name="storage-walk", daemon=True).start()
+        while True:
+            item = items.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    yield from _replay(val)
+
+def _replay(val: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for name, fam in val["families"].items():
+        yield {"family": name, **fam}
+    yield val
+
+def _walk_into(key, db_root: str, max_total_mb: int, out: "queue.Queue"):
+    """Put iter_storage_status items on out, then None (or the exception)."""
+    global _STATUS
+    try:
+        with _STATUS_LOCK:
+            # another request may have walked while we waited
+            exp, k, val = _STATUS
+            if k == key and time.monotonic() < exp:
+                for item in _replay(val):
+                    out.put(item)
+            else:
+                for item in _walk_status(db_root, max_total_mb):
+                    if "families" in item:  # the summary, so the walk completed
+                        _STATUS = (time.monotonic() + _STATUS_TTL, key, item)
+                    out.put(item)
+        out.put(None)
+    except Exception as e:
+        out.put(e)
+
+def _listing(path: str) -> Tuple[list, int, int]:
+    """One scandir pass: (subdir entries, bytes of plain files, count of plain files)."""
+    dirs, nbytes, nfiles = [], 0, 0
+    try:
+        it = os.scandir(path)
+    except OSError:
+        return dirs, 0, 0
+    with it:
+        for e in it:
+            try:
+                if e.is_dir():
+                    dirs.append(e)
+                elif e.is_file(follow_symlinks=False):
+                    nbytes += e.stat(follow_symlinks=False).st_size
+                    nfiles += 1
+            except OSError:
+                pass
+    return dirs, nbytes, nfiles
+
+def _storage_status(db_root: str, max_total_mb: int) -> Dict[str, Any]:
+    """The full status: the last item of _walk_status()."""
+    item = None
+    for item in _walk_status(db_root, max_total_mb):
+        pass
+    return item
+
+def _walk_status(db_root: str, max_total_mb: int) -> Iterator[Dict[str, Any]]:
+    """
+    Yields {"family", "mb", "files"} as each family finishes summing, then
+    the full status dict. Supports either (DB_LAYOUT "flat"):
       DB_ROOT/
         continuous/
         conditional/
         onchange/
-    or:
+    or (DB_LAYOUT "chunks"):
       DB_ROOT/
         chunks/
           continuous/
           conditional/
           onchange/
+    With DB_LAYOUT unset, the layout is detected on each walk.
     """
-    families: Dict[str, Any] = {}
-    total_bytes = 0
-    files_total = 0
-
-    if os.path.isdir(db_root):
-        # list immediate subdirs
-        level1 = [e for e in os.scandir(db_root) if e.is_dir()]
-        # If exactly one wrapper dir (e.g., "chunks"), flatten one level down
-        scan_dirs = level1
-        if len(level1) == 1:
-            inner = [e for e in os.scandir(level1[0].path) if e.is_dir()]
-            if inner:
-                # treat inner dirs as families
-                db_root = level1[0].path
-                scan_dirs = inner
-
-        for d in scan_dirs:
-            st = _family_stats(db_root, d.name)
-            families[d.name] = {"mb": st["mb"], "files": st["files"], "bytes": st["bytes"]}
-            total_bytes += st["bytes"]
-            files_total += st["files"]
-
-        # count any top-level files as well
-        for e in os.scandir(db_root):
-            if e.is_file():
-                try:
-                    total_bytes += e.stat().st_size
-                    files_total += 1
-                except OSError:
-                    pass
+    if DB_LAYOUT == "chunks":
+        db_root = os.path.join(db_root, "chunks")
+    # one listing per level: the family dirs, plus the top-level files' totals
+    dirs, total_bytes, files_total = _listing(db_root)
+    # Layout not configured: if exactly one wrapper dir (e.g., "chunks"),
+    # flatten one level down
+    if DB_LAYOUT not in ("chunks", "flat") and len(dirs) == 1:
+        inner = _listing(dirs[0].path)
+        if inner[0]:
+            # treat inner dirs as families
+            db_root = dirs[0].path
+            dirs, total_bytes, files_total = inner
+
+    families: Dict[str, Any] = dict.fromkeys(d.name for d in dirs)  # keeps listing order
+    idx = index_for(db_root)
+    if idx is not None:
+        # watched tree: sizes come from the in-memory index, no stat()s
+        sums = ((d.name, idx.sum_under(d.path)) for d in dirs)
+    elif not EXACT_SIZES and _CHUNK_BYTES:
+        sums = ((d.name, _estimate_files_under(d.path)) for d in dirs)
+    # family subtrees are independent and the walk is syscall-bound, so they
+    # are summed concurrently (each task returns its own totals; no locking)
+    # and reported in completion order
+    elif len(dirs) > 1:
+        ex = ThreadPoolExecutor(max_workers=min(8, len(dirs)))
+        futs = {ex.submit(_sum_files_under, d.path): d.name for d in dirs}
+        ex.shutdown(wait=False)
+        sums = ((futs[f], f.result()) for f in as_completed(futs))
+    else:
+        sums = ((d.name, _sum_files_under(d.path)) for d in dirs)
+    for name, (bytes_, files_) in sums:
+        families[name] = fam = {"mb": round(bytes_ / MB, 1), "files": files_}
+        total_bytes += bytes_
+        files_total += files_
+        yield {"family": name, **fam}
 
     cap_bytes = int(max_total_mb or 0) * MB
     pct_of_cap = min(100.0, (total_bytes * 100.0) / cap_bytes) if cap_bytes > 0 else 0.0
 
     def mb(n: int) -> float: return round(n / MB, 1)
 
-    return {
+    yield {
         "root": db_root,
+        "summary_only": False,
         "total_mb": mb(total_bytes),
         "cap_mb": float(max_total_mb or 0),
         "pct_of_cap": round(pct_of_cap, 1),
         "files_total": files_total,
-        "families": {k: {"mb": v.get("mb", 0.0), "files": v.get("files", 0)} for k, v in families.items()},
+        "families": families,
+        **_fs_usage(db_root),
         # no single-DB fields anymore
         "db_mb": 0.0, "wal_mb": 0.0, "shm_mb": 0.0,
         "auto_vacuum": None, "auto_vacuum_label": "N/A",
@@ -5,12 +5,21 @@ import os, sys
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, BASE_DIR)
 
-from web import create_app   # imports from webapp/__init__.py
-
-app = create_app()
+from wsgi import app   # the one create_app() call, shared with gunicorn's wsgi:app
 
 if __name__ == "__main__":
     host = os.environ.get("FLASK_HOST", "0.0.0.0")
     port = int(os.environ.get("FLASK_PORT", "8080"))
     debug = os.environ.get("FLASK_DEBUG", "0") == "1"
-    app.run(host=host, port=port, debug=debug)
+    # Production runs under gunicorn (wsgi:app, see Install Instructions.txt).
+    # For a quick manual run, prefer waitress if present so a CSV export
+    # doesn't hold up /status polling; the Werkzeug server is for debugging.
+    if not debug:
+        try:
+            from waitress import serve
+        except ImportError:
+            serve = None
+        if serve is not None:
+            serve(app, host=host, port=port, threads=int(os.environ.get("WEB_THREADS", "8")))
+            sys.exit(0)
+    app.run(host=host, port=port, debug=debug, threaded=True)
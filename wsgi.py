@@ -1,3 +1,4 @@
 # wsgi.py
 from web import create_app
 app = create_app()
+application = app  # conventional WSGI name (gunicorn wsgi:application)